@@ -0,0 +1,110 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_logging.logger import Logger
+from src.strategyviz.viz_logging.metrics import RunMetrics, file_size
+from src.strategyviz.viz_config.paths import get_model_path, get_strategy_path, get_strategy_name, get_out_path
+from src.strategyviz.strategy2pta.converter import convert, ConversionOptions
+from src.strategyviz.strategy2pta.pta import PTA
+from src.strategyviz.upp2pta.converter import parse_uppaal_model
+from src.strategyviz.pta2upp.uppgenerator import to_uppaal_model
+
+LOGGER = Logger('BATCH')
+
+# (model, TIGA strategy, optimized strategy or None)
+Entry = Tuple[str, str, str]
+
+
+def parse_manifest(manifest_path: str):
+    # one conversion per line: MODEL TIGA_STRATEGY [OPT_STRATEGY]
+    # each item is either a path or a name resolved as in main.py, lines starting with '#' are ignored
+    entries: List[Entry] = []
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            fields = line.split()
+            if len(fields) == 0 or fields[0].startswith('#'):
+                continue
+            if len(fields) < 2:
+                LOGGER.error('Invalid manifest line: {}'.format(line.strip()))
+                raise RuntimeError
+            entries.append((fields[0], fields[1], fields[2] if len(fields) > 2 else None))
+    return entries
+
+
+def convert_entry(entry: Entry, network: List[PTA], options: ConversionOptions):
+    model, tiga, stratego = entry
+    model_path = get_model_path(model)
+    tiga_path = get_strategy_path(tiga, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+    if stratego is not None:
+        stratego_path = get_strategy_path(stratego, get_config()['STRATEGY CONFIGURATION']['STRATEGO_EXT'])
+    else:
+        stratego_path = None
+
+    out_name = '_'.join([get_strategy_name(p) for p in [model_path, tiga_path, stratego_path] if p is not None])
+    # one metrics line per conversion, the model is parsed (and recorded) once per batch
+    metrics = RunMetrics(out_name, model=model_path, tiga=tiga_path, stratego=stratego_path)
+    strategized_ptas = convert(tiga_path, stratego_path, options=options, network=network, metrics=metrics)
+    out_path = get_out_path(out_name)
+    with metrics.stage('to_uppaal_model', ptas=len(strategized_ptas), bytes=file_size(model_path)) as record:
+        to_uppaal_model(strategized_ptas, model_path, out_path)
+        record['bytes_out'] = file_size(out_path)
+    metrics.save()
+    return out_path
+
+
+def try_convert_entry(entry: Entry, network: List[PTA], options: ConversionOptions):
+    # failures are returned rather than raised, so that one invalid strategy does not stop the batch
+    try:
+        return convert_entry(entry, network, options), None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+def convert_all(entries: List[Entry], workers: int = 1, options: ConversionOptions = None):
+    if options is None:
+        options = ConversionOptions(render='none')
+
+    # each model is parsed once and shared by all the strategies converted against it
+    by_model: Dict[str, List[Entry]] = dict()
+    for entry in entries:
+        by_model.setdefault(get_model_path(entry[0]), []).append(entry)
+
+    out_paths: List[str] = []
+    failed: List[Entry] = []
+    metrics = RunMetrics('batch', entries=len(entries), workers=workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for model, model_entries in by_model.items():
+            LOGGER.info('Converting {} strategies against {}...'.format(len(model_entries), model))
+            with metrics.stage('parse_model', model=model, bytes=file_size(model)):
+                network = parse_uppaal_model(model)
+            n = len(model_entries)
+            if workers > 1:
+                results = executor.map(try_convert_entry, model_entries, [network] * n, [options] * n)
+            else:
+                results = map(try_convert_entry, model_entries, [network] * n, [options] * n)
+
+            for entry, (out_path, error) in zip(model_entries, results):
+                if error is not None:
+                    LOGGER.error('Conversion of {} failed: {}'.format(' '.join([x for x in entry if x is not None]),
+                                                                      error))
+                    failed.append(entry)
+                else:
+                    out_paths.append(out_path)
+
+    LOGGER.msg('{}/{} strategies successfully converted.'.format(len(out_paths), len(entries)))
+    metrics.attrs['failed'] = len(failed)
+    metrics.save()
+    return out_paths, failed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        LOGGER.error('Not enough input parameters.')
+        raise RuntimeError
+
+    WORKERS = int(sys.argv[2]) if len(sys.argv) >= 3 else 1
+    _, FAILED = convert_all(parse_manifest(sys.argv[1]), WORKERS)
+    if len(FAILED) > 0:
+        sys.exit(1)
@@ -0,0 +1,72 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('IMPORT TIME CHECK')
+
+# main.py imports the package as src.strategyviz and reads the configuration relative to the repository root
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# modules --dry-run must not import: the conversion pipeline and its heavy dependencies
+FORBIDDEN = ['src.strategyviz.strategy2pta', 'src.strategyviz.upp2pta', 'src.strategyviz.pta2upp',
+             'src.strategyviz.z3gen', 'numpy', 'xml', 'tqdm', 'graphviz', 'z3', 'urllib', 'http', 'ssl']
+
+
+def run_dry(args: List[str]):
+    # (wall time in seconds, return code, [(module, cumulative import time in us)], other stderr lines)
+    # of a dry run of main.py
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'src.strategyviz.main'] + args + ['--dry-run'],
+                          cwd=REPO_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    imports: List[Tuple[str, int]] = []
+    errors: List[str] = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            errors.append(line)
+        elif 'cumulative' not in line:
+            fields = line[len('import time:'):].split('|')
+            imports.append((fields[2].strip(), int(fields[1])))
+    return elapsed, proc.returncode, imports, errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='importtime_check',
+                                     description='Checks that a dry run of main.py does not import the conversion '
+                                                 'pipeline and returns within the time budget.')
+    parser.add_argument('model', nargs='?', default='resources/generated_models/traffic_optimized.xml',
+                        help='model passed to main.py (relative to the repository root)')
+    parser.add_argument('tiga_strategy', nargs='?', default='gosafe', help='TIGA strategy passed to main.py')
+    parser.add_argument('opt_strategy', nargs='?', default='gofastsafe', help='optimized strategy passed to main.py')
+    parser.add_argument('--expected-code', type=int, default=0,
+                        help='return code of the dry run (1 if some of the files are missing)')
+    parser.add_argument('--budget-ms', type=float, default=100.0, help='wall time budget of the dry run')
+    parser.add_argument('--runs', type=int, default=5, help='the fastest run is compared with the budget')
+    ARGS = parser.parse_args()
+
+    RUNS = [run_dry([ARGS.model, ARGS.tiga_strategy, ARGS.opt_strategy]) for _ in range(ARGS.runs)]
+    ELAPSED = min([run[0] for run in RUNS]) * 1000
+    _, CODE, IMPORTS, ERRORS = RUNS[0]
+
+    FAILED = False
+    # a dry run that crashes is fast, but proves nothing
+    if CODE != ARGS.expected_code or any(['Traceback' in line for line in ERRORS]):
+        LOGGER.error('Dry run returned {} (expected {}):\n{}'.format(CODE, ARGS.expected_code, '\n'.join(ERRORS)))
+        sys.exit(1)
+    for name, _ in IMPORTS:
+        if any([name == f or name.startswith(f + '.') for f in FORBIDDEN]):
+            LOGGER.error('{} is imported by a dry run.'.format(name))
+            FAILED = True
+    for name, cumulative in sorted(IMPORTS, key=lambda i: -i[1])[:5]:
+        LOGGER.info('{}: {:.1f}ms'.format(name, cumulative / 1000))
+    if ELAPSED > ARGS.budget_ms:
+        LOGGER.error('Dry run took {:.0f}ms, over the {:.0f}ms budget.'.format(ELAPSED, ARGS.budget_ms))
+        FAILED = True
+    else:
+        LOGGER.msg('Dry run took {:.0f}ms ({:.0f}ms budget).'.format(ELAPSED, ARGS.budget_ms))
+    sys.exit(1 if FAILED else 0)
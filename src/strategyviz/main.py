@@ -1,17 +1,61 @@
+import argparse
+import os
+import sys
+
+from src.strategyviz import __version__
+
+parser = argparse.ArgumentParser(prog='strategyviz',
+                                 description='Converts Uppaal Stratego strategies into PTA and generates the '
+                                             'strategized Uppaal model.')
+parser.add_argument('model', help='name of (or path to) the original Uppaal .xml model')
+parser.add_argument('tiga_strategy', help='name of (or path to) the TIGA strategy to convert')
+parser.add_argument('opt_strategy', nargs='?', help='name of (or path to) the optimized strategy refining the TIGA one')
+parser.add_argument('--version', action='version', version='%(prog)s ' + __version__)
+parser.add_argument('--dry-run', action='store_true', help='resolve and check the input files, without converting')
+ARGS = parser.parse_args()
+
+# the conversion pipeline is only imported once arguments are valid and the run is not a dry one,
+# so that --help, --version and --dry-run return immediately
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_config.paths import get_model_path, get_strategy_path, get_strategy_name, get_out_path
 from src.strategyviz.viz_logging.logger import Logger
-from src.strategyviz.strategy2pta.converter import convert
-from src.strategyviz.pta2upp.uppgenerator import to_uppaal_model
 
 LOGGER = Logger('MAIN')
 
+MODEL_PATH = get_model_path(ARGS.model)
+TIGA_PATH = get_strategy_path(ARGS.tiga_strategy, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+# optimized strategy is an optional parameter
+if ARGS.opt_strategy is not None:
+    STRATEGO_PATH = get_strategy_path(ARGS.opt_strategy, get_config()['STRATEGY CONFIGURATION']['STRATEGO_EXT'])
+else:
+    STRATEGO_PATH = None
+MODEL_NAME = get_strategy_name(MODEL_PATH)
+OUT_PATH = get_out_path(MODEL_NAME)
+
+if ARGS.dry_run:
+    missing = [path for path in [MODEL_PATH, TIGA_PATH, STRATEGO_PATH] if path is not None and not os.path.isfile(path)]
+    for path in missing:
+        LOGGER.error('Missing {}.'.format(path))
+    LOGGER.msg('Output model would be generated in {}.'.format(OUT_PATH))
+    sys.exit(1 if len(missing) > 0 else 0)
+
+from src.strategyviz.strategy2pta.converter import convert
+from src.strategyviz.pta2upp.uppgenerator import to_uppaal_model
+from src.strategyviz.viz_logging.metrics import RunMetrics, file_size
+
 LOGGER.info('Starting conversion...')
 
-strategized_pta = convert()
+METRICS = RunMetrics(MODEL_NAME, model=MODEL_PATH, tiga=TIGA_PATH, stratego=STRATEGO_PATH)
+
+strategized_ptas = convert(TIGA_PATH, STRATEGO_PATH, MODEL_PATH, metrics=METRICS)
 
 LOGGER.msg('Conversion complete.')
 
 LOGGER.info('Starting Uppaal model generation...')
 
-to_uppaal_model(strategized_pta)
+with METRICS.stage('to_uppaal_model', ptas=len(strategized_ptas), bytes=file_size(MODEL_PATH)) as RECORD:
+    to_uppaal_model(strategized_ptas, MODEL_PATH, OUT_PATH)
+    RECORD['bytes_out'] = file_size(OUT_PATH)
+METRICS.save()
 
 LOGGER.msg('Uppaal model successfully generated.')
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import pickle
+from typing import Callable, TypeVar
+
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('PARSE CACHE')
+
+# must be increased whenever parsers or parsed classes change,
+# so that entries pickled by a previous version are not loaded
+PARSER_VERSION = 6
+
+T = TypeVar('T')
+
+
+def cache_enabled():
+    return get_config().getboolean('CACHE CONFIGURATION', 'USE_CACHE', fallback=False)
+
+
+def file_hash(path: str):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cached(kind: str, name: str, path: str, parse: Callable[[], T]) -> T:
+    # returns the object parsed from path, loading it from the cache directory
+    # if the same file content has already been parsed by the same parser version
+    if not cache_enabled():
+        return parse()
+
+    CACHE_PATH = get_config()['CACHE CONFIGURATION']['CACHE_PATH']
+    entry_path = os.path.join(CACHE_PATH, '{}_{}_{}_v{}.pickle'.format(kind, name, file_hash(path), PARSER_VERSION))
+
+    if os.path.exists(entry_path):
+        try:
+            with open(entry_path, 'rb') as f:
+                obj = pickle.load(f)
+            LOGGER.info('Loaded {} from cache.'.format(path))
+            return obj
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            LOGGER.warn('Invalid cache entry {}, parsing again.'.format(entry_path))
+
+    obj = parse()
+
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    # written to a temporary file first, so that an interrupted run does not leave a truncated entry
+    tmp_path = entry_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, entry_path)
+    LOGGER.debug('Cached {} in {}.'.format(path, entry_path))
+
+    return obj
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Callable, Dict, TypeVar
+
+from src.strategyviz.parse_cache.cache import PARSER_VERSION
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('FINGERPRINTS')
+
+T = TypeVar('T')
+
+
+def incremental_enabled():
+    return get_config().getboolean('CACHE CONFIGURATION', 'INCREMENTAL', fallback=False)
+
+
+def fingerprint(*parts: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(p.encode())
+        h.update(b'\0')
+    return h.digest()
+
+
+class Fingerprints:
+    # results of the previous run of the same conversion step, keyed by the fingerprint of their input:
+    # results whose input did not change are reused, and only the ones used by the current run are stored back
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        CACHE_PATH = get_config()['CACHE CONFIGURATION']['CACHE_PATH']
+        self.path = os.path.join(CACHE_PATH, 'incremental_{}_{}_v{}.pickle'.format(kind, name, PARSER_VERSION))
+
+        self.previous: Dict[bytes, Any] = dict()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as f:
+                    self.previous = pickle.load(f)
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                LOGGER.warn('Invalid fingerprints {}, computing everything again.'.format(self.path))
+        self.current: Dict[bytes, Any] = dict()
+        self.hits = 0
+        self.lookups = 0
+
+    def reuse(self, fp: bytes):
+        # result computed by the previous run from the same input, None if there is none
+        result = self.previous.get(fp)
+        self.lookups += 1
+        if result is not None:
+            self.current[fp] = result
+            self.hits += 1
+        return result
+
+    def store(self, fp: bytes, result):
+        self.current[fp] = result
+
+    def get(self, fp: bytes, compute: Callable[[], T]) -> T:
+        result = self.reuse(fp)
+        if result is None:
+            result = compute()
+            self.store(fp, result)
+        return result
+
+    def save(self):
+        # results must be saved before they are modified by later steps
+        LOGGER.info('Reused {}/{} {} results from the previous run.'.format(self.hits, self.lookups, self.kind))
+        if self.hits == self.lookups and self.current.keys() == self.previous.keys():
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.current, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
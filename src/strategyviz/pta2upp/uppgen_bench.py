@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as et
+from typing import List
+
+from src.strategyviz.pta2upp.uppgenerator import get_new_coord, get_template_name, to_uppaal_model
+from src.strategyviz.strategy2pta.pta import PTA, BranchPoint, Edge, Location, NetLocation
+from src.strategyviz.viz_config.paths import get_model_path
+from src.strategyviz.viz_logging.logger import Logger
+from src.strategyviz.viz_logging.metrics import file_size, peak_rss_mb
+
+LOGGER = Logger('UPPAAL GENERATOR BENCHMARK')
+
+MODES = ['stream', 'tree']
+
+
+def synthetic_pta(n_locs: int, n_edges: int):
+    # one location per row, edges to pseudo-random targets, every tenth one through a branchpoint
+    locs = [Location([NetLocation('Bench', 'L{}'.format(i))], initial=i == 0, invariant='x <= {}'.format(i % 50))
+            for i in range(n_locs)]
+    bps = [BranchPoint('bp{}'.format(i)) for i in range(n_edges // 10)]
+    edges: List[Edge] = []
+    for i in range(n_edges):
+        start = locs[i % n_locs]
+        end = bps[i // 10] if i % 10 == 0 and i // 10 < len(bps) else locs[(i * 7919) % n_locs]
+        edges.append(Edge('x >= {} && x < {} && y == {}'.format(i % 30, i % 30 + 5, i % 3), '', 'x := 0',
+                          start, end))
+    return PTA('trimmed_bench', locs, edges, bps, 'clock x;\nint y;')
+
+
+def tree_uppaal_model(ptas: List[PTA], model_path: str, out_path: str):
+    # reference: the original model and the generated templates are built as a tree, which is then written
+    tree = et.parse(model_path)
+    root = tree.getroot()
+    before = [i for i, c in enumerate(root) if c.tag in ['system', 'queries']]
+    pos = before[0] if len(before) > 0 else len(root)
+    for pta in ptas:
+        tplt = et.Element('template')
+        et.SubElement(tplt, 'name', {'x': '9', 'y': '9'}).text = get_template_name(pta)
+        et.SubElement(tplt, 'declaration').text = pta.declarations
+        ids = {}
+        positions = {}
+        x = y = 0
+        for i, l in enumerate(pta.locations):
+            x, y = get_new_coord(x, y)
+            ids[l.label] = 'id' + str(i)
+            positions[ids[l.label]] = (x, y)
+            loc = et.SubElement(tplt, 'location', {'id': ids[l.label], 'x': str(x), 'y': str(y)})
+            et.SubElement(loc, 'name', {'x': str(x), 'y': str(y - 10)}).text = l.label.split('.')[-1]
+            et.SubElement(loc, 'label', {'kind': 'invariant', 'x': str(x), 'y': str(y - 15)}).text = l.invariant
+        for i, bp in enumerate(pta.branchpoints):
+            x, y = get_new_coord(x, y)
+            ids[bp.label] = 'id' + str(i + len(pta.locations))
+            positions[ids[bp.label]] = (x, y)
+            et.SubElement(tplt, 'branchpoint', {'id': ids[bp.label], 'x': str(x), 'y': str(y)})
+        for i, e in enumerate(pta.edges):
+            new_id = 'id' + str(i + len(pta.locations) + len(pta.branchpoints))
+            tr = et.SubElement(tplt, 'transition', {'id': new_id, 'controllable': 'false'})
+            et.SubElement(tr, 'source', {'ref': ids[e.start.label]})
+            et.SubElement(tr, 'target', {'ref': ids[e.end.label]})
+            start, end = positions[ids[e.start.label]], positions[ids[e.end.label]]
+            pos_attrs = {'x': str((end[0] - start[0]) / 2), 'y': str((end[1] - start[1]) / 2)}
+            et.SubElement(tr, 'label', dict(kind='guard', **pos_attrs)).text = e.guard.replace('<-', '< -')
+            et.SubElement(tr, 'label', dict(kind='synchronisation', **pos_attrs)).text = e.sync
+            et.SubElement(tr, 'label', dict(kind='assignment', **pos_attrs)).text = e.update
+        root.insert(pos, tplt)
+        pos += 1
+    tree.write(out_path)
+
+
+def run_mode(mode: str, model_path: str, n_locs: int, n_edges: int):
+    # peak RSS is measured as the growth of the process peak while writing, the PTA being already built
+    pta = synthetic_pta(n_locs, n_edges)
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, 'bench_optimized.xml')
+        before = peak_rss_mb()
+        start = time.perf_counter()
+        if mode == 'stream':
+            to_uppaal_model([pta], model_path, out_path)
+        else:
+            tree_uppaal_model([pta], model_path, out_path)
+        elapsed = time.perf_counter() - start
+        return {'mode': mode, 'wall_s': round(elapsed, 3), 'rss_growth_mb': round(peak_rss_mb() - before, 1),
+                'out_mb': round(file_size(out_path) / (1 << 20), 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='uppgen_bench',
+                                     description='Compares time and peak RSS of the streaming UPPAAL model writer '
+                                                 'with building the output model as a tree.')
+    parser.add_argument('model', help='name of (or path to) the original model')
+    parser.add_argument('--locations', type=int, default=20000, help='locations of the synthetic PTA')
+    parser.add_argument('--edges', type=int, default=200000, help='edges of the synthetic PTA')
+    parser.add_argument('--mode', choices=MODES, help='only run one mode, in this process')
+    ARGS = parser.parse_args()
+
+    MODEL_PATH = get_model_path(ARGS.model)
+    if ARGS.mode is not None:
+        print(json.dumps(run_mode(ARGS.mode, MODEL_PATH, ARGS.locations, ARGS.edges)))
+        sys.exit(0)
+
+    # each mode runs in its own process, so that the peak RSS of one does not hide the other's
+    for MODE in MODES:
+        OUT = subprocess.run([sys.executable, '-m', 'src.strategyviz.pta2upp.uppgen_bench', MODEL_PATH,
+                              '--locations', str(ARGS.locations), '--edges', str(ARGS.edges), '--mode', MODE],
+                             stdout=subprocess.PIPE, text=True, check=True).stdout
+        # the result follows the child's log messages
+        RES = json.loads(OUT[OUT.rindex('{'):])
+        LOGGER.msg('{}: {}s, peak RSS +{}MB, {}MB written.'.format(MODE, RES['wall_s'], RES['rss_growth_mb'],
+                                                                     RES['out_mb']))
@@ -1,16 +1,10 @@
-import configparser
-import sys
+import re
 import xml.etree.ElementTree as et
-import xml.etree.cElementTree as cet
+from typing import Dict, List, TextIO
 
 from src.strategyviz.strategy2pta.pta import PTA
 from src.strategyviz.viz_logging.logger import Logger
 
-config = configparser.ConfigParser()
-config.sections()
-config.read("./resources/config/config.ini")
-config.sections()
-
 LOGGER = Logger('UPPAAL MODEL GENERATOR')
 
 
@@ -24,51 +18,46 @@ def get_new_coord(x: int, y: int):
         return x + incr, y
 
 
-def to_uppaal_model(pta: PTA):
-    if len(sys.argv) < 3:
-        LOGGER.error("Wrong input parameters.")
-        raise RuntimeError
-
-    MODEL_NAME = sys.argv[1]
-    MODEL_PATH = config['MODEL CONFIGURATION']['MODEL_PATH'] + MODEL_NAME + config['MODEL CONFIGURATION']['MODEL_EXT']
-
-    tree = et.parse(MODEL_PATH)
-    root = tree.getroot()
-
-    new_root: cet.Element = cet.Element('nta')
-
-    # COPY GLOBAL DECLARATIONS
-    only_global = True
-    for gd in root.iter('declaration'):
-        if not only_global:
-            break
-        global_declarations = cet.SubElement(new_root, 'declaration')
-        global_declarations.text = gd.text
-        only_global = False
-
-    # COPY EXISTING TEMPLATES
-    LOGGER.debug('Copying existing templates...')
-    pta_local_content = ''
-    for tplt in root.iter('template'):
-        tplt_copy = cet.SubElement(new_root, 'template')
-        # TODO: fix me, it's hard-coded
-        if tplt.find('name').text == 'Traveler':
-            pta_local_content = tplt.find('declaration').text
-
-        for c in tplt.getchildren():
-            new_c = cet.SubElement(tplt_copy, c.tag, c.attrib)
-            new_c.text = c.text
-            for c2 in c.getchildren():
-                new_c2 = cet.SubElement(new_c, c2.tag, c2.attrib)
-                new_c2.text = c2.text
+# same as xml.sax.saxutils, which is not imported as it also imports urllib, http.client and ssl
+def escape(text: str):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def quoteattr(value: str):
+    value = escape(value).replace('"', '&quot;')
+    return '"' + value.replace('\n', '&#10;').replace('\r', '&#13;').replace('\t', '&#9;') + '"'
+
+
+def start_tag(tag: str, attrib: Dict[str, str]):
+    return '<' + tag + ''.join([' {}={}'.format(k, quoteattr(v)) for k, v in attrib.items()]) + '>'
+
 
+def leaf(tag: str, attrs: str = '', text: str = None):
+    # attrs are already formatted, text is escaped
+    if not text:
+        return '<{}{} />'.format(tag, attrs)
+    return '<{}{}>{}</{}>'.format(tag, attrs, escape(text), tag)
+
+
+def write_element(out: TextIO, element: et.Element):
+    # copies an element of the original model as it is, with its whole subtree
+    out.write(start_tag(element.tag, element.attrib))
+    if element.text is not None:
+        out.write(escape(element.text))
+    for c in element:
+        write_element(out, c)
+        if c.tail is not None:
+            out.write(escape(c.tail))
+    out.write('</{}>'.format(element.tag))
+
+
+def write_template(out: TextIO, pta: PTA):
     # ADD TEMPLATE FOR NEW STRATEGY PTA
-    new_template = cet.SubElement(new_root, 'template')
-    new_tplt_name = cet.SubElement(new_template, 'name', {'x': '9', 'y': '9'})
-    new_tplt_name.text = pta.name.split('_')[-1]
+    # elements are formatted directly: ids and coordinates never need escaping
+    out.write('<template>')
+    out.write(leaf('name', ' x="9" y="9"', get_template_name(pta)))
     # ADD LOCAL DECLARATIONS
-    new_declaration = cet.SubElement(new_template, 'declaration')
-    new_declaration.text = pta.declarations
+    out.write(leaf('declaration', '', pta.declarations))
 
     # ADD LOCATIONS
     LOGGER.debug('Adding locations...')
@@ -82,16 +71,12 @@ def to_uppaal_model(pta: PTA):
         new_id = 'id' + str(i)
         ids[l.label] = new_id
         positions[new_id] = (x, y)
-        new_attrib = {'id': new_id, 'x': str(x), 'y': str(y)}
-        new_loc = cet.SubElement(new_template, 'location', new_attrib)
-        new_name = cet.SubElement(new_loc, 'name', {'x': str(x), 'y': str(y - 10)})
-        new_name.text = l.label.split('.')[-1]
-        new_invariant = cet.SubElement(new_loc, 'label', {'kind': 'invariant', 'x': str(x), 'y': str(y - 15)})
-        new_invariant.text = l.invariant
-
+        out.write('<location id="{}" x="{}" y="{}">'.format(new_id, x, y))
+        out.write(leaf('name', ' x="{}" y="{}"'.format(x, y - 10), l.label.split('.')[-1]))
+        out.write(leaf('label', ' kind="invariant" x="{}" y="{}"'.format(x, y - 15), l.invariant))
         if l.urgent > 0:
-            new_urgency_label = 'urgent' if l.urgent == 1 else 'committed'
-            new_urgency = cet.SubElement(new_loc, new_urgency_label)
+            out.write(leaf('urgent' if l.urgent == 1 else 'committed'))
+        out.write('</location>')
 
         if l.initial:
             init_id = new_id
@@ -102,52 +87,75 @@ def to_uppaal_model(pta: PTA):
         new_id = 'id' + str(i + len(pta.locations))
         ids[bp.label] = new_id
         positions[new_id] = (x, y)
-        new_attrib = {'id': new_id, 'x': str(x), 'y': str(y)}
-        new_bp = cet.SubElement(new_template, 'branchpoint', new_attrib)
+        out.write(leaf('branchpoint', ' id="{}" x="{}" y="{}"'.format(new_id, x, y)))
 
     # ADD INITIAL LOCATION MARKER
-    new_init = cet.SubElement(new_template, 'init', {'ref': init_id})
+    out.write(leaf('init', ' ref="{}"'.format(init_id)))
 
     # ADD EDGES
     LOGGER.debug('Adding edges...')
     for i, e in enumerate(pta.edges):
         new_id = 'id' + str(i + len(pta.locations) + len(pta.branchpoints))
-        new_edge = cet.SubElement(new_template, 'transition', {'id': new_id, 'controllable': 'false'})
-        new_start = cet.SubElement(new_edge, 'source', {'ref': ids[e.start.label]})
-        new_end = cet.SubElement(new_edge, 'target', {'ref': ids[e.end.label]})
+        out.write('<transition id="{}" controllable="false">'.format(new_id))
+        out.write(leaf('source', ' ref="{}"'.format(ids[e.start.label])))
+        out.write(leaf('target', ' ref="{}"'.format(ids[e.end.label])))
         labels_pos = ((positions[ids[e.end.label]][0] - positions[ids[e.start.label]][0]) / 2,
                       (positions[ids[e.end.label]][1] - positions[ids[e.start.label]][1]) / 2)
-        new_guard = cet.SubElement(new_edge, 'label',
-                                   {'kind': 'guard', 'x': str(labels_pos[0]), 'y': str(labels_pos[1])})
-        new_guard.text = e.guard.replace('<-', '< -')
-        new_sync = cet.SubElement(new_edge, 'label',
-                                  {'kind': 'synchronisation', 'x': str(labels_pos[0]), 'y': str(labels_pos[1])})
-        new_sync.text = e.sync
-        new_update = cet.SubElement(new_edge, 'label',
-                                    {'kind': 'assignment', 'x': str(labels_pos[0]), 'y': str(labels_pos[1])})
-        new_update.text = e.update
+        labels_attrs = ' x="{}" y="{}"'.format(labels_pos[0], labels_pos[1])
+        out.write(leaf('label', ' kind="guard"' + labels_attrs, e.guard.replace('<-', '< -')))
+        out.write(leaf('label', ' kind="synchronisation"' + labels_attrs, e.sync))
+        out.write(leaf('label', ' kind="assignment"' + labels_attrs, e.update))
         if e.weight is not None:
-            new_weight = cet.SubElement(new_edge, 'label',
-                                        {'kind': 'probability', 'x': str(labels_pos[0]), 'y': str(labels_pos[1])})
-            new_weight.text = e.weight
-
-    # COPY SYSTEM DECLARATION
-    for s in root.iter('system'):
-        system_decl = cet.SubElement(new_root, 'system')
-        system_decl.text = s.text
-
-    # COPY QUERIES
-    for q in root.iter('queries'):
-        new_queries = cet.SubElement(new_root, 'queries')
-
-        for c in q.getchildren():
-            new_c = cet.SubElement(new_queries, c.tag, c.attrib)
-            new_c.text = c.text
-            for c2 in c.getchildren():
-                new_c2 = cet.SubElement(new_c, c2.tag, c2.attrib)
-                new_c2.text = c2.text
-
-    new_tree = cet.ElementTree(new_root)
-
-    OUT_PATH = config['MODEL CONFIGURATION']['MODEL_OUT_PATH']
-    new_tree.write(OUT_PATH + sys.argv[1] + '_optimized.xml')
+            out.write(leaf('label', ' kind="probability"' + labels_attrs, e.weight))
+        out.write('</transition>')
+
+    out.write('</template>')
+
+
+def get_template_name(pta: PTA):
+    # PTA names are prefixed by the steps they went through (e.g., trimmed_optimized_trimmed_gosafe)
+    return re.sub(r'^((trimmed|optimized)_)+', '', pta.name)
+
+
+def to_uppaal_model(ptas: List[PTA], model_path: str, out_path: str):
+    # the output model is written while the original one is read, one top-level element at a time:
+    # neither of them is ever entirely in memory, non-ASCII characters are written as character references
+    with open(out_path, 'w', encoding='us-ascii', errors='xmlcharrefreplace') as out:
+        out.write('<nta>')
+        LOGGER.debug('Copying existing templates...')
+
+        depth = 0
+        root = None
+        only_global = True
+        ptas_written = False
+        for event, node in et.iterparse(model_path, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = node
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+
+            # COPY GLOBAL DECLARATIONS, EXISTING TEMPLATES, SYSTEM DECLARATION AND QUERIES
+            if node.tag == 'declaration':
+                if only_global:
+                    write_element(out, node)
+                    only_global = False
+            elif node.tag in ['system', 'queries'] and not ptas_written:
+                # ADD ONE TEMPLATE FOR EACH STRATEGY PTA, after the existing ones
+                for pta in ptas:
+                    write_template(out, pta)
+                ptas_written = True
+                write_element(out, node)
+            else:
+                write_element(out, node)
+            # elements already written are released
+            root.clear()
+
+        if not ptas_written:
+            for pta in ptas:
+                write_template(out, pta)
+
+        out.write('</nta>')
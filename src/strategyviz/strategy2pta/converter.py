@@ -1,41 +1,34 @@
-import configparser
-import sys
-import time
-from typing import Set
+from collections import deque
+from typing import List, Set
 
-from src.strategyviz.strategy2pta.pta import PTA, Location
+from src.strategyviz.parse_cache.cache import cached, cache_enabled
+from src.strategyviz.parse_cache.fingerprints import Fingerprints, incremental_enabled
+from src.strategyviz.strategy2pta.pta import PTA
+from src.strategyviz.strategy2pta.renderer import Renderer
 from src.strategyviz.strategy2pta.stratego_parser import parse_optimized_strategy
 from src.strategyviz.strategy2pta.tigaparser import parse_tiga_strategy, TigaStrategy
 from src.strategyviz.upp2pta.converter import parse_uppaal_model
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_config.paths import get_strategy_name
 from src.strategyviz.viz_logging.logger import Logger
-
-config = configparser.ConfigParser()
-config.sections()
-config.read("./resources/config/config.ini")
-config.sections()
+from src.strategyviz.viz_logging.metrics import RunMetrics, file_size
 
 LOGGER = Logger('STRATEGY2PTA CONVERTER')
 
 
-def connected_to_root(pta: PTA, curr_loc: Location, already_checked: Set[Location]):
-    already_checked.add(curr_loc)
-    if curr_loc.kind == 'LOC' and curr_loc.initial:
-        return True
-    else:
-        incoming_edges = list(filter(lambda e: e.end.label == curr_loc.label, pta.edges))
-        predecessors = set([e.start for e in incoming_edges])
-        to_add = set()
-        for p in predecessors:
-            if p.kind == 'BP':
-                edges_to_bp = list(filter(lambda e: e.end.label == p.label, pta.edges))
-                to_add.update(set([e.start for e in edges_to_bp]))
-        predecessors.update(to_add)
-        predecessors = set(filter(lambda p: p.kind == 'LOC', predecessors))
-        predecessors = set(filter(lambda p: p not in already_checked and p != curr_loc, predecessors))
-        if len(predecessors) == 0:
-            return False
-        else:
-            return any([connected_to_root(pta, p, already_checked) for p in predecessors])
+def reachable_from_root(pta: PTA):
+    # single BFS pass from the initial location(s) over the forward adjacency index,
+    # branchpoints are traversed as any other node
+    roots = set([l.label for l in pta.locations if l.initial])
+    reachable: Set[str] = set(roots)
+    to_visit = deque(roots)
+    while len(to_visit) > 0:
+        curr_label = to_visit.popleft()
+        for succ in pta.successors(curr_label):
+            if succ.label not in reachable:
+                reachable.add(succ.label)
+                to_visit.append(succ.label)
+    return reachable
 
 
 def clean_pta(pta: PTA):
@@ -47,96 +40,167 @@ def clean_pta(pta: PTA):
         if e.end.label == initial_loc.label:
             e.end.initial = True
 
-    # cleans unconnected locations
-    unconnected_locs = set()
-    checked_locs = set()
-    for l in pta.locations + pta.branchpoints:
-        checked_locs.add(l)
-        if not connected_to_root(pta, l, set()):
-            unconnected_locs.add(l)
-
-    unconnected_edges = list(filter(lambda e: (e.start in unconnected_locs) or
-                                              (e.end in unconnected_locs), pta.edges))
-
-    new_locs = list(set(pta.locations) - set(unconnected_locs))
-    new_edges = list(set(pta.edges) - set(unconnected_edges))
-    new_pta = PTA('trimmed_' + pta.name, new_locs, new_edges, pta.branchpoints)
-
-    edges_to_recheck = list(filter(lambda e: e.start not in checked_locs or e.end not in checked_locs, new_pta.edges))
-    # cleans unconnected locations which are present only as edges start/end
-    for e in edges_to_recheck:
-        if not connected_to_root(new_pta, e.start, set()):
-            unconnected_locs.add(e.start)
-            unconnected_edges.append(e)
-        if not connected_to_root(new_pta, e.end, set()):
-            unconnected_locs.add(e.end)
-            unconnected_edges.append(e)
-
-    new_locs = list(set(new_pta.locations) - unconnected_locs)
-    new_edges = list(set(new_pta.edges) - set(unconnected_edges))
-
-    # cleans breakpoints
-    new_bps = list(set(pta.branchpoints) - set(unconnected_locs))
-
-    new_pta = PTA('trimmed_' + pta.name, new_locs, new_edges, new_bps, pta.declarations)
-
-    return new_pta
-
-
-def convert():
-    if len(sys.argv) < 3:
-        LOGGER.error('Not enough input parameters.')
-        raise RuntimeError
-
-    start_ts = time.time()
-    STRATEGIES_PATH = config['STRATEGY CONFIGURATION']['STRATEGY_PATH']
-    TIGA_PATH = STRATEGIES_PATH + sys.argv[2] + config['STRATEGY CONFIGURATION']['TIGA_EXT']
-    # optimized strategy is an optional parameter
-    if len(sys.argv) >= 4:
-        STRATEGO_PATH = STRATEGIES_PATH + sys.argv[3] + config['STRATEGY CONFIGURATION']['STRATEGO_EXT']
-    else:
-        STRATEGO_PATH = None
-
-    with open(TIGA_PATH) as tiga_strategy_file:
-        LOGGER.info("Parsing TIGA strategy...")
-        lines = tiga_strategy_file.readlines()
-        tiga_strategy: TigaStrategy = parse_tiga_strategy(sys.argv[2], lines)
-        network = parse_uppaal_model(view=False)
-        tiga_strategy_pta = tiga_strategy.to_pta(network, view=True)
-        LOGGER.msg("TIGA strategy successfully parsed.")
+    # cleans unconnected locations, edges and branchpoints
+    reachable = reachable_from_root(pta)
+    new_locs = [l for l in pta.locations if l.label in reachable]
+    new_edges = [e for e in pta.edges if e.start.label in reachable and e.end.label in reachable]
+    new_bps = [bp for bp in pta.branchpoints if bp.label in reachable]
+
+    LOGGER.debug('Trimmed {}/{} edges.'.format(len(pta.edges) - len(new_edges), len(pta.edges)))
+
+    return PTA('trimmed_' + pta.name, new_locs, new_edges, new_bps, pta.declarations)
+
+
+def load_tiga_strategy(name: str, tiga_strategy_file, workers: int = 1):
+    # all the blocks are kept in memory, so that they can be cached: unlike streaming them, this is proportional to
+    # the size of the strategy (hence USE_CACHE is off by default)
+    tiga_strategy = parse_tiga_strategy(name, tiga_strategy_file, workers)
+    tiga_strategy.blocks = list(tiga_strategy.blocks)
+    return tiga_strategy
+
+
+def load_optimized_strategy(name: str, path: str, fingerprints: Fingerprints = None):
+    with open(path) as opt_strategy_file:
+        return parse_optimized_strategy(name, opt_strategy_file, fingerprints)
+
+
+class ConversionOptions:
+    # rendering settings left to None are read from the configuration file (see renderer.Renderer)
+    def __init__(self, tiga_workers: int = None, render: str = None, render_format: str = None, view: bool = None,
+                 combine_edges: bool = None, projection_workers: int = None, incremental: bool = None):
+        if tiga_workers is None:
+            tiga_workers = get_config()['STRATEGY CONFIGURATION'].getint('TIGA_WORKERS', fallback=1)
+        if projection_workers is None:
+            projection_workers = get_config()['STRATEGY CONFIGURATION'].getint('PROJECTION_WORKERS', fallback=1)
+        if incremental is None:
+            incremental = incremental_enabled()
+        if combine_edges is None:
+            combine_edges = get_config()['PTA CONFIGURATION'].getboolean('COMBINE_EDGES', fallback=False)
+        self.tiga_workers = tiga_workers
+        self.combine_edges = combine_edges
+        self.projection_workers = projection_workers
+        # results whose input did not change since the previous run are reused (see parse_cache.fingerprints)
+        self.incremental = incremental
+        self.render = render
+        self.render_format = render_format
+        self.view = view
+
+
+def timed_clean_pta(pta: PTA, metrics: RunMetrics):
+    with metrics.stage('clean_pta', pta=pta.name, edges_in=len(pta.edges)) as record:
         try:
-            tiga_strategy_pta = clean_pta(tiga_strategy_pta)
+            pta = clean_pta(pta)
         except IndexError:
             LOGGER.error("An error occurred while trimming the PTA.")
-        tiga_strategy_pta.plot()
-    end_ts = time.time()
-    LOGGER.msg("TA extraction from TIGA strategy took {:.2f}s.".format(end_ts - start_ts))
+        record['edges_out'] = len(pta.edges)
+    return pta
+
+
+def timed_render(pta: PTA, renderer: Renderer, metrics: RunMetrics, final: bool = False):
+    # PTAs that are not rendered do not get a stage
+    if renderer.renders(final):
+        with metrics.stage('render', pta=pta.name):
+            renderer.submit(pta, final)
+
+
+def refine(pta: PTA, optimized_strategy, options: ConversionOptions, renderer: Renderer, metrics: RunMetrics):
+    timed_render(pta, renderer, metrics)
+    pta = timed_clean_pta(pta, metrics)
+    timed_render(pta, renderer, metrics)
+
+    if optimized_strategy is not None:
+        with metrics.stage('refine_pta', pta=pta.name, edges_in=len(pta.edges)) as record:
+            pta = optimized_strategy.refine_pta(pta)
+            record['edges_out'] = len(pta.edges)
+            record['edges_removed'] = record['edges_in'] - record['edges_out']
+
+    pta = timed_clean_pta(pta, metrics)
+
+    # pta.equalities2intervals()
+    if options.combine_edges:
+        with metrics.stage('combine_edges', pta=pta.name, edges_in=len(pta.edges)) as record:
+            if options.incremental:
+                fingerprints = Fingerprints('combine', pta.name)
+                pta.combine_edges(fingerprints)
+                fingerprints.save()
+            else:
+                pta.combine_edges()
+            record['edges_out'] = len(pta.edges)
+    timed_render(pta, renderer, metrics, final=True)
+    return pta
+
+
+def convert(tiga_path: str, stratego_path: str = None, model_path: str = None,
+            options: ConversionOptions = None, network: List[PTA] = None, metrics: RunMetrics = None):
+    # returns one PTA for each automaton of the network controlled by the strategy;
+    # the network can be passed already parsed, to convert multiple strategies against the same model;
+    # stages are recorded in metrics, which the caller saves once the run is over
+    if options is None:
+        options = ConversionOptions()
+    if metrics is None:
+        metrics = RunMetrics(get_strategy_name(tiga_path))
+    if network is None:
+        if model_path is None:
+            LOGGER.error('Either the model path or the parsed network is required.')
+            raise RuntimeError
+        with metrics.stage('parse_model', bytes=file_size(model_path)):
+            network = parse_uppaal_model(model_path, view=False)
+
+    renderer = Renderer(options.render, options.render_format, options.view)
+
+    tiga_name = get_strategy_name(tiga_path)
+
+    # blocks are parsed while they are projected, unless they are loaded from the cache:
+    # parsing and projection are recorded as a single stage
+    with open(tiga_path) as tiga_strategy_file, \
+            metrics.stage('tiga_to_ptas', bytes=file_size(tiga_path)) as record:
+        LOGGER.info("Parsing TIGA strategy...")
+        fingerprints = None
+        if options.incremental:
+            # unchanged blocks are projected as in the previous run, changed ones are parsed and projected again
+            fingerprints = Fingerprints('tiga', tiga_name)
+            tiga_strategy: TigaStrategy = parse_tiga_strategy(tiga_name, tiga_strategy_file, fingerprinted=True)
+        elif cache_enabled():
+            # blocks must be materialized to be cached
+            tiga_strategy: TigaStrategy = cached('tiga', tiga_name, tiga_path, lambda: load_tiga_strategy(
+                tiga_name, tiga_strategy_file, options.tiga_workers))
+        else:
+            tiga_strategy: TigaStrategy = parse_tiga_strategy(tiga_name, tiga_strategy_file, options.tiga_workers)
+        tiga_strategy_ptas = tiga_strategy.to_ptas(network, options.projection_workers, fingerprints)
+        if fingerprints is not None:
+            fingerprints.save()
+        record['ptas'] = len(tiga_strategy_ptas)
+        record['edges'] = sum([len(pta.edges) for pta in tiga_strategy_ptas])
+        LOGGER.msg("TIGA strategy successfully parsed.")
+    LOGGER.msg("TA extraction from TIGA strategy took {:.2f}s.".format(metrics.wall_time('tiga_to_ptas')))
 
     # if the path to an optimized strategy has been specified,
     # use it to refine the TIGA strategy
-    if STRATEGO_PATH is not None:
-        start_ts = time.time()
+    optimized_strategy = None
+    if stratego_path is not None:
         LOGGER.info("Parsing optimized strategy...")
 
-        with open(STRATEGO_PATH) as opt_strategy_file:
-            data: str = opt_strategy_file.read()
-            optimized_strategy = parse_optimized_strategy(sys.argv[3], data)
-
-        final_pta = optimized_strategy.refine_pta(tiga_strategy_pta)
+        stratego_name = get_strategy_name(stratego_path)
+        with metrics.stage('parse_stratego', bytes=file_size(stratego_path)) as record:
+            if options.incremental:
+                fingerprints = Fingerprints('stratego', stratego_name)
+                optimized_strategy = load_optimized_strategy(stratego_name, stratego_path, fingerprints)
+                fingerprints.save()
+            else:
+                optimized_strategy = cached('stratego', stratego_name, stratego_path,
+                                            lambda: load_optimized_strategy(stratego_name, stratego_path))
+            record['regressors'] = len(optimized_strategy.regressors)
         LOGGER.msg("Optimized strategy successfully parsed.")
-    else:
-        final_pta = tiga_strategy_pta
 
-    try:
-        final_pta = clean_pta(final_pta)
-    except IndexError:
-        LOGGER.error("An error occurred while trimming the PTA.")
+    final_ptas = [refine(pta, optimized_strategy, options, renderer, metrics) for pta in tiga_strategy_ptas]
 
-    end_ts = time.time()
-    LOGGER.msg("PTA extraction from optimized strategy took {:.2f}s.".format(end_ts - start_ts))
+    # nothing to wait for if nothing was rendered
+    if renderer.policy != 'none':
+        with metrics.stage('render', pta=None):
+            renderer.wait()
 
-    # final_pta.equalities2intervals()
-    # final_pta.combine_edges()
-    final_pta.plot()
+    # from the parsing of the optimized strategy (if any) to the final PTAs
+    LOGGER.msg("PTA extraction from optimized strategy took {:.2f}s.".format(
+        metrics.wall_time('parse_stratego', 'clean_pta', 'refine_pta', 'combine_edges')))
 
-    return final_pta
+    return final_ptas
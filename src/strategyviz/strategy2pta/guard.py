@@ -0,0 +1,378 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# reference 'variable' (always 0) of single-variable bounds:
+# x<=c is stored as x-ZERO<=c, x>=c as ZERO-x<=-c
+ZERO = ''
+
+# bounds are encoded as in UPPAAL DBMs: (c, <=) -> 2c+1, (c, <) -> 2c,
+# hence the tighter of two bounds is the smaller one; None is the unbounded one
+Bound = Optional[int]
+Key = Tuple[str, str]
+
+# parsed guards and unions memoised, least recently used first out
+CACHE_SIZE = 1 << 16
+
+IDENTIFIER = r'[A-Za-z_][\w.]*(?:\[\d+\])*'
+ATOM = re.compile(r'^\s*({id}(?:\s*-\s*{id})?|-?\d+)\s*(<=|>=|==|<|>)\s*({id}(?:\s*-\s*{id})?|-?\d+)\s*$'
+                  .format(id=IDENTIFIER))
+
+
+def bound(c: int, strict: bool) -> int:
+    return 2 * c + (0 if strict else 1)
+
+
+def bound_value(b: int):
+    return b >> 1
+
+
+def is_strict(b: int):
+    return b & 1 == 0
+
+
+def looser(b1: Bound, b2: Bound) -> Bound:
+    if b1 is None or b2 is None:
+        return None
+    return max(b1, b2)
+
+
+def tighter(b1: Bound, b2: Bound) -> Bound:
+    if b1 is None:
+        return b2
+    if b2 is None:
+        return b1
+    return min(b1, b2)
+
+
+def add(b1: int, b2: int) -> int:
+    # (c1, ~1) + (c2, ~2): the sum is strict if any of the two is
+    return b1 + b2 - ((b1 & 1) | (b2 & 1))
+
+
+def negate(b: int) -> int:
+    # not(x-y ~ c) <=> y-x ~' -c
+    return 1 - b
+
+
+def parse_term(term: str):
+    # returns (x, y, k) such that term = x - y + k
+    term = term.replace(' ', '')
+    if re.fullmatch(r'-?\d+', term):
+        return ZERO, ZERO, int(term)
+    fields = term.split('-')
+    if len(fields) == 2:
+        return fields[0], fields[1], 0
+    return term, ZERO, 0
+
+
+def enclosed(atom: str):
+    # whether the atom is entirely within a pair of parentheses, e.g., (a || b) but not (a) || (b)
+    if not atom.startswith('(') or not atom.endswith(')'):
+        return False
+    depth = 0
+    for i, ch in enumerate(atom):
+        depth += 1 if ch == '(' else -1 if ch == ')' else 0
+        if depth == 0:
+            return i == len(atom) - 1
+    return False
+
+
+def parenthesize(atom: str):
+    # disjunctions kept as a single atom must stay one once conjoined with other atoms
+    return atom if '||' not in atom or enclosed(atom) else '(' + atom + ')'
+
+
+class Guard:
+    # conjunction of difference constraints x-y ~ c (DBM-style, single-variable
+    # bounds are differences with ZERO) plus the conjuncts that cannot be represented as such,
+    # which are kept verbatim; discrete variables are integer-valued, hence their bounds are never strict
+    __slots__ = ('bounds', 'others', 'discrete', '_hash')
+
+    def __init__(self, bounds: Dict[Key, int] = None, others: Iterable[str] = (),
+                 discrete: FrozenSet[str] = frozenset()):
+        self.bounds: Dict[Key, int] = dict()
+        self.others: Tuple[str, ...] = tuple(dict.fromkeys(others))
+        self.discrete = discrete
+        for key, b in (bounds or dict()).items():
+            self.bounds[key] = self.normalize(key, b)
+        self._hash = hash((frozenset(self.bounds.items()), frozenset(self.others)))
+
+    def is_discrete(self, key: Key):
+        return all([v == ZERO or v in self.discrete for v in key])
+
+    def normalize(self, key: Key, b: int):
+        # x-y<c <=> x-y<=c-1 on integers
+        if is_strict(b) and self.is_discrete(key):
+            return b - 1
+        return b
+
+    @staticmethod
+    def parse(guard: str, discrete: FrozenSet[str] = frozenset()):
+        return parse_guard(guard, discrete)
+
+    @staticmethod
+    def from_equalities(valuation: Iterable[Tuple[str, str]]):
+        # guard of a discrete valuation, e.g., the state variables of a TIGA state
+        bounds: Dict[Key, int] = dict()
+        others: List[str] = []
+        for var, value in valuation:
+            value = str(value).strip()
+            if re.fullmatch(r'-?\d+', value):
+                bounds[(var, ZERO)] = bound(int(value), False)
+                bounds[(ZERO, var)] = bound(-int(value), False)
+            else:
+                others.append('{}=={}'.format(var, value))
+        return Guard(bounds, others, frozenset([var for var, _ in valuation]))
+
+    def equalities(self):
+        # variables constrained to a single value
+        res: Dict[str, int] = dict()
+        for (x, y), b in self.bounds.items():
+            if y == ZERO and x != ZERO and not is_strict(b):
+                lower = self.bounds.get((ZERO, x))
+                if lower is not None and not is_strict(lower) and bound_value(lower) == -bound_value(b):
+                    res[x] = bound_value(b)
+        return res
+
+    def variables(self):
+        return set([v for key in self.bounds for v in key if v != ZERO])
+
+    def conjoin(self, other: 'Guard'):
+        bounds = dict(self.bounds)
+        for key, b in other.bounds.items():
+            bounds[key] = tighter(bounds.get(key), b)
+        return Guard(bounds, self.others + other.others, self.discrete | other.discrete)
+
+    def includes(self, other: 'Guard'):
+        # syntactic subsumption: every constraint of self is implied by a tighter one of other
+        for key, b in self.bounds.items():
+            other_b = other.bounds.get(key)
+            if other_b is None or other_b > b:
+                return False
+        return set(self.others).issubset(other.others)
+
+    def interval(self, var: str):
+        return self.bounds.get((ZERO, var)), self.bounds.get((var, ZERO))
+
+    def gap(self, upper: Bound, lower: Bound, var: str):
+        # whether there are values of var above upper and below lower
+        if upper is None or lower is None:
+            return False
+        if var in self.discrete:
+            return -bound_value(lower) - bound_value(upper) >= 2
+        return add(negate(upper), negate(lower)) >= 1
+
+    def union(self, other: 'Guard') -> Optional['Guard']:
+        # exact union, if it is convex (i.e., representable as a single guard), None otherwise
+        if self.includes(other):
+            return self
+        if other.includes(self):
+            return other
+        if set(self.others) != set(other.others):
+            return None
+
+        keys = set(self.bounds.keys()) | set(other.bounds.keys())
+        diff = [k for k in keys if self.bounds.get(k) != other.bounds.get(k)]
+        discrete = self.discrete & other.discrete
+        if len(diff) == 1:
+            # A&&b1 || A&&b2 <=> A&&(looser of b1, b2)
+            bounds = {k: b for k, b in self.bounds.items() if k != diff[0]}
+            loose = looser(self.bounds.get(diff[0]), other.bounds.get(diff[0]))
+            if loose is not None:
+                bounds[diff[0]] = loose
+            return Guard(bounds, self.others, discrete)
+
+        variables = set([v for k in diff for v in k if v != ZERO])
+        if len(variables) != 1 or any([ZERO not in k for k in diff]):
+            return None
+        var = variables.pop()
+        lower_1, upper_1 = self.interval(var)
+        lower_2, upper_2 = other.interval(var)
+        probe = Guard(discrete=discrete)
+        if probe.gap(upper_1, lower_2, var) or probe.gap(upper_2, lower_1, var):
+            return None
+
+        bounds = {k: b for k, b in self.bounds.items() if k not in diff}
+        for key, b in [((ZERO, var), looser(lower_1, lower_2)), ((var, ZERO), looser(upper_1, upper_2))]:
+            if b is not None:
+                bounds[key] = b
+        return Guard(bounds, self.others, discrete)
+
+    def atoms(self):
+        res: List[str] = []
+        done = set()
+        for (x, y), b in self.bounds.items():
+            if (x, y) in done:
+                continue
+            done.add((x, y))
+            op = '<' if is_strict(b) else '<='
+            c = bound_value(b)
+            var = y if x == ZERO else x
+            upper, lower = self.bounds.get((var, ZERO)), self.bounds.get((ZERO, var))
+            if ZERO in (x, y) and upper is not None and lower is not None \
+                    and not is_strict(upper) and lower == bound(-bound_value(upper), False):
+                done.update([(var, ZERO), (ZERO, var)])
+                res.append('{}=={}'.format(var, bound_value(upper)))
+            elif y == ZERO:
+                res.append('{}{}{}'.format(x, op, c))
+            elif x == ZERO:
+                res.append('{}{}{}'.format(y, '>' if is_strict(b) else '>=', -c))
+            else:
+                res.append('{}-{}{}{}'.format(x, y, op, c))
+        return res + [parenthesize(o) for o in self.others]
+
+    def __str__(self):
+        # UPPAAL syntax
+        return ' && '.join(self.atoms())
+
+    def __eq__(self, other):
+        return self._hash == other._hash and self.bounds == other.bounds and set(self.others) == set(other.others)
+
+    def __hash__(self):
+        return self._hash
+
+    def __getstate__(self):
+        return self.bounds, self.others, self.discrete
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+TRUE = Guard()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_guard(guard: str, discrete: FrozenSet[str] = frozenset()):
+    # guards are parsed once: the same guard string is shared by many edges
+    if guard is None or guard.strip() == '':
+        return TRUE
+    bounds: Dict[Key, int] = dict()
+    others: List[str] = []
+    atoms: List[str] = []
+    for conjunct in guard_conjuncts(guard):
+        if '||' in conjunct:
+            # disjunctions are not convex, they are kept as a whole
+            others.append(parenthesize(conjunct))
+        else:
+            atoms.extend(conjunct.replace('(', '').replace(')', '').split('&&'))
+    for atom in atoms:
+        atom = atom.strip()
+        if atom == '':
+            continue
+        match = ATOM.match(atom)
+        if match is None:
+            others.append(atom)
+            continue
+        lhs, op, rhs = match.groups()
+        # lhs ~ rhs <=> x-y ~ c
+        lx, ly, lk = parse_term(lhs)
+        rx, ry, rk = parse_term(rhs)
+        if (lx != ZERO and rx != ZERO and (ly != ZERO or ry != ZERO)) or (lx == ZERO and rx == ZERO):
+            # more than two variables, or no variable at all
+            others.append(atom)
+            continue
+        if lx == ZERO:
+            # constant on the left: c ~ x-y <=> y-x ~' -c
+            x, y, c = rx, ry, lk
+            op = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '=='}[op]
+        elif rx != ZERO:
+            # x ~ y <=> x-y ~ 0
+            x, y, c = lx, rx, rk - lk
+        else:
+            x, y, c = lx, ly, rk
+        if op in ['<', '<=', '==']:
+            key, b = (x, y), bound(c, op == '<')
+            bounds[key] = tighter(bounds.get(key), b)
+        if op in ['>', '>=', '==']:
+            key, b = (y, x), bound(-c, op == '>')
+            bounds[key] = tighter(bounds.get(key), b)
+
+    return Guard(bounds, others, discrete)
+
+
+def merge_guards(guards: Iterable[Guard]) -> List[Guard]:
+    # merges guards into as few convex ones as possible: for each variable,
+    # guards only differing in the interval of that variable are sorted by lower bound and swept
+    merged = list(dict.fromkeys(guards))
+    changed = True
+    while changed and len(merged) > 1:
+        changed = False
+        variables = set()
+        for g in merged:
+            variables.update(g.variables())
+        for var in sorted(variables):
+            buckets: Dict[Tuple, List[Guard]] = dict()
+            for g in merged:
+                rest = frozenset([(k, b) for k, b in g.bounds.items() if k not in [(ZERO, var), (var, ZERO)]])
+                buckets.setdefault((rest, frozenset(g.others)), []).append(g)
+            if all([len(bucket) == 1 for bucket in buckets.values()]):
+                continue
+
+            merged = []
+            for bucket in buckets.values():
+                # ascending lower bound, unbounded first
+                bucket.sort(key=lambda g: -g.bounds[(ZERO, var)] if (ZERO, var) in g.bounds else float('-inf'))
+                curr = bucket[0]
+                for g in bucket[1:]:
+                    union = curr.union(g)
+                    if union is None:
+                        merged.append(curr)
+                        curr = g
+                    else:
+                        curr = union
+                        changed = True
+                merged.append(curr)
+
+    return merged
+
+
+def guard_conjuncts(guard: str):
+    # top-level conjuncts only: conjunctions within parenthesized disjunctions are not split
+    res: List[str] = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(guard):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif depth == 0 and guard.startswith('&&', i):
+            res.append(guard[start:i])
+            start = i + 2
+    res.append(guard[start:])
+    return [c.strip() for c in res if c.strip() != '']
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def union_guards(guards: Tuple[str, ...], discrete: FrozenSet[str] = frozenset()):
+    # disjunction of guards, with the conjuncts shared by all guards factored out;
+    # consecutive values are only collapsed into an interval for discrete variables (there are values in between
+    # consecutive values of a clock)
+    # results are memoised for the lifetime of the process only
+    if len(guards) == 1:
+        return guards[0]
+
+    conjuncts = [guard_conjuncts(g) for g in guards]
+    common = [c for c in conjuncts[0] if all([c in other for other in conjuncts[1:]])]
+    rests = [[c for c in conj if c not in common] for conj in conjuncts]
+
+    if any([len(r) == 0 for r in rests]):
+        # one of the guards is implied by all the others
+        merged = []
+    elif all([len(r) == 1 and r[0].count('==') == 1 for r in rests]) \
+            and len(set([r[0].split('==')[0] for r in rests])) == 1 \
+            and all([r[0].split('==')[1].lstrip('-').isdigit() for r in rests]):
+        # guards only differ in the value of a single variable
+        var = rests[0][0].split('==')[0]
+        values = sorted(set([int(r[0].split('==')[1]) for r in rests]))
+        if len(values) == 1:
+            merged = ['{}=={}'.format(var, values[0])]
+        elif var in discrete and values[-1] - values[0] == len(values) - 1:
+            merged = ['{}<={}'.format(values[0], var), '{}<={}'.format(var, values[-1])]
+        else:
+            merged = ['(' + '||'.join(['{}=={}'.format(var, v) for v in values]) + ')']
+    else:
+        merged = ['(' + ' ||\n'.join(['&&'.join(r) for r in rests]) + ')']
+
+    return ' &&\n'.join(common + merged)
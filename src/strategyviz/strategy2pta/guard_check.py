@@ -0,0 +1,71 @@
+import argparse
+import random
+import re
+import sys
+from typing import Dict, List, Tuple
+
+from src.strategyviz.strategy2pta.guard import Guard
+from src.strategyviz.strategy2pta.tigaparser import parse_tiga_strategy
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_config.paths import get_strategy_path
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('GUARD CHECK')
+
+IDENTIFIER = re.compile(r'[A-Za-z_#][A-Za-z0-9_#]*')
+
+
+def to_python(guard: str):
+    # UPPAAL guards only differ from Python expressions in their boolean operators (and # in clock names)
+    return guard.replace('&&', ' and ').replace('||', ' or ').replace('#', '_h_').replace('\n', ' ')
+
+
+def holds(guard: str, valuation: Dict[str, int]):
+    if guard.strip() == '':
+        return True
+    return eval(to_python(guard), {}, {k.replace('#', '_h_'): v for k, v in valuation.items()})
+
+
+def strategy_guards(path: str):
+    # each TIGA guard conjoined with the valuation of its state, as projected edges get them (see project_block)
+    guards: List[Tuple[str, Guard]] = []
+    with open(path) as f:
+        for block in parse_tiga_strategy('check', f).blocks:
+            values = [(v.identifier, v.value) for v in block.state.state.vars]
+            tiga_guards = [e.guard for e in block.edges] + ([block.wait.guard] if block.wait is not None else [])
+            for g in tiga_guards:
+                original = ' && '.join(['{}=={}'.format(x, v) for x, v in values] + ['(' + g + ')'])
+                guards.append((original, Guard.from_equalities(values).conjoin(Guard.parse(g))))
+    return guards
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='guard_check',
+                                     description='Checks that guards rendered back to UPPAAL syntax are parsed '
+                                                 'as the same guards and hold in the same valuations.')
+    parser.add_argument('tiga_strategy', nargs='?', default='gosafe', help='name of (or path to) the TIGA strategy')
+    parser.add_argument('--samples', type=int, default=200, help='random valuations per guard')
+    ARGS = parser.parse_args()
+
+    TIGA_PATH = get_strategy_path(ARGS.tiga_strategy, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+    RND = random.Random(0)
+    FAILED = 0
+    GUARDS = strategy_guards(TIGA_PATH)
+    for ORIGINAL, GUARD in GUARDS:
+        RENDERED = str(GUARD)
+        if Guard.parse(RENDERED, GUARD.discrete) != GUARD:
+            LOGGER.error('{} is parsed back differently from {}.'.format(RENDERED, ORIGINAL))
+            FAILED += 1
+            continue
+        VARS = set(IDENTIFIER.findall(ORIGINAL))
+        for _ in range(ARGS.samples):
+            VALUATION = {v: RND.randint(-2, 70) for v in VARS}
+            if holds(ORIGINAL, VALUATION) != holds(RENDERED, VALUATION):
+                LOGGER.error('{} and {} differ in {}.'.format(RENDERED, ORIGINAL, VALUATION))
+                FAILED += 1
+                break
+
+    if FAILED > 0:
+        LOGGER.error('{}/{} guards are not rendered back correctly.'.format(FAILED, len(GUARDS)))
+        sys.exit(1)
+    LOGGER.msg('{} guards rendered back correctly.'.format(len(GUARDS)))
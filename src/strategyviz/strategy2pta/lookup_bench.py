@@ -0,0 +1,72 @@
+import argparse
+import random
+import time
+from typing import List
+
+from src.strategyviz.strategy2pta.pta import PTA, BranchPoint, Edge, Location, NetLocation, State, StateVariable
+from src.strategyviz.strategy2pta.tiga_strategy import TigaBlock, TigaEdge, TigaState, TigaStrategy, TigaWait
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('LOOKUP BENCHMARK')
+
+TPLT = 'Bench'
+
+
+def synthetic_network(n_locs: int, rnd: random.Random):
+    # one automaton with out_degree edges per location, half of them controllable,
+    # the uncontrollable ones through a branchpoint every tenth location
+    locs = [Location([NetLocation(TPLT, 'L{}'.format(i))], initial=i == 0, invariant='x <= {}'.format(i % 50))
+            for i in range(n_locs)]
+    bps: List[BranchPoint] = []
+    edges: List[Edge] = []
+    for i, l in enumerate(locs):
+        for j in range(4):
+            end = locs[rnd.randrange(n_locs)]
+            if j % 2 == 0:
+                edges.append(Edge('x >= {}'.format(j), '', 'x := 0', l, end, controllable=True))
+            elif i % 10 == 0:
+                bps.append(BranchPoint('bp{}'.format(len(bps))))
+                edges.append(Edge('', '', '', l, bps[-1]))
+                edges.append(Edge('', '', '', bps[-1], end, weight='1'))
+            else:
+                edges.append(Edge('x > {}'.format(j), '', '', l, end))
+    return PTA(TPLT, locs, edges, bps, 'clock x;')
+
+
+def synthetic_strategy(network: PTA, n_states: int, rnd: random.Random):
+    # strategy states in random locations, one in four waiting
+    blocks: List[TigaBlock] = []
+    for i in range(n_states):
+        loc = rnd.choice(network.locations).net_locs[0]
+        state = State([loc], [StateVariable('v', str(i % 3))])
+        if i % 4 == 0:
+            blocks.append(TigaBlock(TigaState(state), [], TigaWait('x <= 10')))
+            continue
+        edges = []
+        for e in network.out_edges.get(loc.label, []):
+            if e.controllable:
+                next_state = State([e.end.net_locs[0]], [StateVariable('v', str(i % 3))])
+                edges.append(TigaEdge('x < {}'.format(i % 20 + 1), '', e.update, next_state, [TPLT]))
+        blocks.append(TigaBlock(TigaState(state), edges, None))
+    return TigaStrategy('bench', blocks, State([network.locations[0].net_locs[0]], [StateVariable('v', '0')]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='lookup_bench',
+                                     description='Times the conversion of synthetic TIGA strategies on networks of '
+                                                 'growing size.')
+    parser.add_argument('--locations', type=int, nargs='+', default=[2000, 4000, 8000],
+                        help='locations of the synthetic networks')
+    parser.add_argument('--states', type=int, default=5, help='strategy states per network location')
+    ARGS = parser.parse_args()
+
+    # time per location stays constant if the conversion scales with blocks + edges
+    for N_LOCS in ARGS.locations:
+        RND = random.Random(0)
+        NETWORK = synthetic_network(N_LOCS, RND)
+        STRATEGY = synthetic_strategy(NETWORK, N_LOCS * ARGS.states, RND)
+        START = time.perf_counter()
+        PTAS = STRATEGY.to_ptas([NETWORK])
+        ELAPSED = time.perf_counter() - START
+        LOGGER.msg('{} locations, {} edges, {} blocks: {:.2f}s ({:.0f}us per location), {} edges out.'.format(
+            N_LOCS, len(NETWORK.edges), len(STRATEGY.blocks), ELAPSED, ELAPSED / N_LOCS * 1e6, len(PTAS[0].edges)))
@@ -0,0 +1,113 @@
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import List
+
+from src.strategyviz.strategy2pta.tiga_strategy import TigaBlock
+from src.strategyviz.strategy2pta.tigaparser import parse_tiga_strategy
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_config.paths import get_strategy_path
+from src.strategyviz.viz_logging.logger import Logger
+from src.strategyviz.viz_logging.metrics import peak_rss_mb
+
+LOGGER = Logger('MEMORY BENCHMARK')
+
+
+# baseline: the classes as they were before __slots__ and interning, i.e., plain objects (with a __dict__)
+# holding their own copy of every string
+class PlainNetLocation:
+    def __init__(self, tplt: str, label: str):
+        self.tplt = tplt
+        self.label = label
+
+
+class PlainStateVariable:
+    def __init__(self, identifier: str, value):
+        self.identifier = identifier
+        self.value = value
+
+
+class PlainState:
+    def __init__(self, locs: List[PlainNetLocation], vars: List[PlainStateVariable]):
+        self.locs = locs
+        self.vars = vars
+
+
+class PlainTigaState:
+    def __init__(self, state: PlainState):
+        self.state = state
+
+
+class PlainTigaEdge:
+    def __init__(self, guard: str, sync: str, update: str, next_state: PlainState):
+        self.guard = guard
+        self.sync = sync
+        self.update = update
+        self.next_state = next_state
+
+
+class PlainTigaWait:
+    def __init__(self, guard: str):
+        self.guard = guard
+
+
+class PlainTigaBlock:
+    def __init__(self, state: PlainTigaState, edges: List[PlainTigaEdge], wait: PlainTigaWait):
+        self.state = state
+        self.edges = edges
+        self.wait = wait
+
+
+def copy(s: str):
+    # a new string object, as each parsed line used to produce
+    return (s + '.')[:-1]
+
+
+def plain_state(state):
+    return PlainState([PlainNetLocation(copy(l.tplt), copy(l.label)) for l in state.locs],
+                      [PlainStateVariable(copy(v.identifier), copy(v.value)) for v in state.vars])
+
+
+def plain_block(block: TigaBlock):
+    edges = [PlainTigaEdge(copy(e.guard), copy(e.sync), copy(e.update), plain_state(e.next_state))
+             for e in block.edges]
+    wait = PlainTigaWait(copy(block.wait.guard)) if block.wait is not None else None
+    return PlainTigaBlock(PlainTigaState(plain_state(block.state.state)), edges, wait)
+
+
+def traced(what: str, build):
+    # only what is still allocated once build returns is counted, not the garbage produced meanwhile
+    gc.collect()
+    rss_before = peak_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    res = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    LOGGER.msg('{}: {} blocks, {:.1f}MB allocated ({:.0f} bytes per block), {:.1f}MB at peak, '
+               'peak RSS +{:.1f}MB, built in {:.2f}s (traced).'.format(
+                what, len(res), current / (1 << 20), current / max(1, len(res)), peak / (1 << 20),
+                peak_rss_mb() - rss_before, elapsed))
+    return res, current
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='memory_bench',
+                                     description='Measures the memory taken by the blocks of a parsed TIGA strategy, '
+                                                 'compared with plain objects holding their own strings.')
+    parser.add_argument('tiga_strategy', help='name of (or path to) the TIGA strategy')
+    ARGS = parser.parse_args()
+
+    TIGA_PATH = get_strategy_path(ARGS.tiga_strategy, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+
+    def parse():
+        with open(TIGA_PATH) as tiga_file:
+            return list(parse_tiga_strategy(ARGS.tiga_strategy, tiga_file).blocks)
+
+    BLOCKS, SIZE = traced('slots, interned', parse)
+    # the baseline is built from the parsed blocks, which are not traced
+    PLAIN, PLAIN_SIZE = traced('baseline', lambda: [plain_block(b) for b in BLOCKS])
+    LOGGER.msg('{:.0f}% less memory than the baseline.'.format(100 * (1 - SIZE / max(1, PLAIN_SIZE))))
@@ -1,12 +1,17 @@
-from typing import Dict, List
+from typing import Dict, FrozenSet, Iterable, List, Tuple, Union
 
-from tqdm import tqdm
-
-from src.strategyviz.strategy2pta.pta import State, NetLocation, StateVariable, PTA, Edge
+from src.strategyviz.strategy2pta.pta import State, NetLocation, StateVariable, PTA, Edge, Location
 from src.strategyviz.viz_logging.logger import Logger
 
 LOGGER = Logger('OPTIMIZED STRATEGY')
 
+StateKey = Tuple[str, FrozenSet[Tuple[str, str]]]
+
+
+def state_key(loc_label: str, state_vars: Iterable[StateVariable]) -> StateKey:
+    # canonical (location, discrete valuation) key, shared by regressors and PTA edges
+    return loc_label, frozenset([(v.identifier, str(v.value).strip()) for v in state_vars])
+
 
 class OptimizedState:
     def __init__(self, state: State):
@@ -31,41 +36,69 @@ class OptimizedState:
         return str(self.state)
 
 
+# act->point->val regression tree: either a leaf value or a (point variable index, bound, low, high) node,
+# where low is followed by valuations with the variable up to the bound and high by the others
+Tree = Union[float, Tuple[int, float, 'Tree', 'Tree']]
+
+
+def parse_tree(t) -> Tree:
+    if isinstance(t, dict):
+        return int(t['var']), float(t['bound']), parse_tree(t['low']), parse_tree(t['high'])
+    return float(t)
+
+
+def tree_bounds(t: Tree) -> Tuple[float, float]:
+    # lowest and highest leaf values
+    if isinstance(t, tuple):
+        low, high = tree_bounds(t[2]), tree_bounds(t[3])
+        return min(low[0], high[0]), max(low[1], high[1])
+    return t, t
+
+
 class Regressor:
-    def __init__(self, state: OptimizedState, best_actions: List[str], weight: float):
+    def __init__(self, state: OptimizedState, best_actions: List[str], weight: float,
+                 trees: Dict[str, Tree] = None, minimize: bool = True):
         self.state = state
         self.best_actions = best_actions
         self.payoff = weight
+        # regression tree of each action, over the point variables of the strategy
+        self.trees = trees if trees is not None else dict()
+        self.minimize = minimize
 
     @staticmethod
     def parse(key: str, d: Dict, statevars: List[str], location_names: Dict, actions: Dict[str, str]):
         state = OptimizedState.parse(key, statevars, location_names)
 
         minimize = True if d['minimize'] == 1 else False
-        fun = min if minimize else max
 
-        weights: Dict[float, List[str]] = dict()
+        trees: Dict[str, Tree] = dict()
+        # action->(lowest, highest) value
+        bounds: Dict[str, Tuple[float, float]] = dict()
+        state_locs = [str(l) for l in state.state.locs]
         for a in actions:
+            if a not in d['regressor']:
+                # TODO: what does it mean when an action is not part of the regressor?
+                continue
+            trees[actions[a]] = parse_tree(d['regressor'][a])
+
             starting_loc = actions[a].split('->')
-            if actions[a] == 'WAIT' or str(state.state.locs[0]) != starting_loc[0]:
+            if actions[a] == 'WAIT' or starting_loc[0] not in state_locs:
                 continue
+            bounds[actions[a]] = tree_bounds(trees[actions[a]])
 
-            if a in d['regressor']:
-                # we build a dictionary with keys=weights in a regressor
-                # and values=list actions with such weight
-                # the list is necessary in case multiple actions have the same weight
-                try:
-                    weights[float(d['regressor'][a])].append(actions[a])
-                except KeyError:
-                    weights[float(d['regressor'][a])] = [actions[a]]
-            # TODO: what does it mean when an action is not part of the regressor?
+        if len(bounds) == 0:
+            return []
 
-        best_weight = fun(weights.keys())
+        # the best actions are the ones that may be the best for some point valuation:
+        # with flat regressors (a single leaf per action), those with the best value
+        if minimize:
+            best_weight = min([high for _, high in bounds.values()])
+            best_actions = [a for a, (low, _) in bounds.items() if low <= best_weight]
+        else:
+            best_weight = max([low for low, _ in bounds.values()])
+            best_actions = [a for a, (_, high) in bounds.items() if high >= best_weight]
 
-        # if minimize:
-        #    return [Regressor(state, weights[w], -w) for w in weights if w == best_weight]
-        # else:
-        return [Regressor(state, weights[w], w) for w in weights if w == best_weight]
+        return [Regressor(state, best_actions, best_weight, trees, minimize)]
 
     def __str__(self):
         return str(self.state)  # + '\n' + str(self.minimize) + '\n' + str(self.weights)
@@ -75,21 +108,69 @@ class Regressor:
 
 
 class OptimizedStrategy:
-    def __init__(self, name: str, regressors: List[Regressor]):
+    def __init__(self, name: str, regressors: List[Regressor], location_names: Dict = None,
+                 pointvars: List[str] = None):
         self.name = name
         self.regressors = regressors
+        self.location_names = location_names if location_names is not None else dict()
+        # clocks and continuous variables the regression trees split on
+        self.pointvars = pointvars if pointvars is not None else []
+        self._forest = None
+
+        # (location, discrete valuation)->best actions index, built once
+        self.best_actions: Dict[StateKey, List[str]] = dict()
+        self.statevars = set()
+        for r in regressors:
+            self.index(r)
+
+    def index(self, r: Regressor):
+        # each automaton of the state is indexed on its own, as PTAs are projections on a single automaton
+        for l in r.state.state.locs:
+            r_key = state_key(Location([l]).label, r.state.state.vars)
+            actions = [a for a in r.best_actions if a.split('->')[0] == str(l)]
+            if len(actions) > 0:
+                self.best_actions.setdefault(r_key, []).extend(actions)
+        self.statevars.update([v.identifier for v in r.state.state.vars])
+
+    def add(self, r: Regressor):
+        self.regressors.append(r)
+        self.index(r)
+
+    def state_table(self):
+        # regressor states as a NumPy-backed table (numpy is only needed here),
+        # locations are encoded with the same indexes Stratego uses
+        from src.strategyviz.strategy2pta.state_table import StateTable, SymbolTable
+
+        symbols = {col: SymbolTable.from_location_names(names) for col, names in self.location_names.items()}
+        return StateTable.from_states([r.state.state for r in self.regressors], symbols)
+
+    def forest(self):
+        # regression trees compiled into flat node arrays (numpy is only needed here), compiled once;
+        # state i of the forest is the state of the i-th regressor, as in state_table
+        if self._forest is None:
+            from src.strategyviz.strategy2pta.regressor_forest import RegressorForest
+
+            self._forest = RegressorForest.compile(self.regressors, self.pointvars)
+        return self._forest
+
+    def edge_key(self, e: Edge) -> StateKey:
+        # the discrete valuation of the source state is encoded
+        # in the guard as equalities on the state variables
+        valuation = [StateVariable(var, str(value)) for var, value in e.constraint.equalities().items()
+                     if var in self.statevars]
+        return state_key(e.start.label, valuation)
 
     def refine_pta(self, pta: PTA):
+        from tqdm import tqdm
+
         LOGGER.info('Refining TIGA strategy...')
 
         all_edges = len(pta.edges)
 
         edges_to_delete: List[Edge] = []
         for e in tqdm(pta.edges):
-            edge_key = str(e.start) + ', \n' + \
-                       ', '.join([x for x in e.guard.split('&&\n') if x.__contains__('==')]) + ', '
-            if edge_key in list(self.regressors.keys()):
-                best_actions = self.regressors[edge_key]
+            best_actions = self.best_actions.get(self.edge_key(e))
+            if best_actions is not None:
                 best_actions_dest = [a.split(' ')[0].split('->')[1] for a in best_actions]
                 if str(e.end) not in best_actions_dest:
                     edges_to_delete.append(e)
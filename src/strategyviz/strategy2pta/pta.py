@@ -1,25 +1,39 @@
-import configparser
 import math
-from typing import List
-
-from graphviz import Digraph
-from tqdm import tqdm
+import sys
+from typing import List, Dict, Set, Tuple, FrozenSet
 
+from src.strategyviz.parse_cache.fingerprints import Fingerprints, fingerprint
+from src.strategyviz.strategy2pta.guard import Guard, merge_guards, union_guards
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.z3gen.simplifier import simplify_guards, STATS as SIMPLIFIER_STATS
 from src.strategyviz.viz_logging.logger import Logger
-# from src.strategyviz.z3gen.z3constrgenerator import guards2singleconstr
-
-config = configparser.ConfigParser()
-config.sections()
-config.read("./resources/config/config.ini")
-config.sections()
 
 LOGGER = Logger('PTA')
 
+# plotted edges collapsing more guards than this only show a summary of them
+MAX_PLOTTED_GUARDS = 3
+MAX_PLOTTED_VALUES = 5
+
+
+def intern(s):
+    # identifiers and labels repeat across millions of states: share one copy of each
+    return sys.intern(s) if isinstance(s, str) else s
+
 
 class NetLocation:
+    __slots__ = ('tplt', 'label', '_hash')
+
     def __init__(self, tplt: str, label: str):
-        self.tplt = tplt
-        self.label = label
+        self.tplt = intern(tplt)
+        self.label = intern(label)
+        self._hash = hash((self.tplt, self.label))
+
+    # string hashes differ across processes: the cached hash is recomputed when unpickling
+    def __getstate__(self):
+        return self.tplt, self.label
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     @staticmethod
     def parse(line: str):
@@ -30,16 +44,25 @@ class NetLocation:
         return self.tplt + '.' + self.label
 
     def __eq__(self, other):
-        return self.tplt == other.tplt and self.label == other.label
+        return self._hash == other._hash and self.tplt == other.tplt and self.label == other.label
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
 
 class StateVariable:
+    __slots__ = ('identifier', 'value', '_hash')
+
     def __init__(self, identifier: str, value):
-        self.identifier = identifier
-        self.value = value
+        self.identifier = intern(identifier)
+        self.value = intern(value)
+        self._hash = hash((self.identifier, self.value))
+
+    def __getstate__(self):
+        return self.identifier, self.value
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     @staticmethod
     def parse(line: str):
@@ -50,13 +73,15 @@ class StateVariable:
         return self.identifier + '==' + str(self.value)
 
     def __eq__(self, other):
-        return self.identifier == other.identifier and self.value == other.value
+        return self._hash == other._hash and self.identifier == other.identifier and self.value == other.value
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
 
 class State:
+    __slots__ = ('locs', 'vars')
+
     def __init__(self, locs: List[NetLocation], vars: List[StateVariable]):
         self.locs = locs
         self.vars = vars
@@ -77,18 +102,22 @@ class State:
 
 
 class Location:
+    __slots__ = ('net_locs', 'initial', 'label', 'invariant', 'urgent', '_hash')
     kind = 'LOC'
 
     def __init__(self, net_locs: List[NetLocation], initial=False, invariant: str = None, urgent: int = 0):
         self.net_locs = net_locs
         self.initial = initial
-        self.label = ''
-        for i, l in enumerate(net_locs):
-            self.label += str(l)
-            if i < len(net_locs) - 1:
-                self.label += ',\n'
+        self.label = intern(',\n'.join([str(l) for l in net_locs]))
         self.invariant = invariant if invariant is not None else ''
         self.urgent = urgent  # 0: not urgent, not committed, 1: urgent, 2: committed
+        self._hash = hash(self.label)
+
+    def __getstate__(self):
+        return self.net_locs, self.initial, self.invariant, self.urgent
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     def __str__(self):
         return self.label
@@ -97,37 +126,91 @@ class Location:
         return self.label == other.label
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
 
 class Edge:
+    __slots__ = ('_guard', '_constraint', 'sync', 'update', 'start', 'end', 'weight', 'controllable', '_hash')
+
     def __init__(self, guard: str, sync: str, update: str, start, end,
-                 weight: str = None, controllable: bool = False):
-        guard = guard.replace('(', '').replace(')', '').replace(' && ', ' &&\n')
-        self.guard = guard
-        self.sync = sync
-        self.update = update
+                 weight: str = None, controllable: bool = False, constraint: Guard = None):
+        if '||' not in guard:
+            # parentheses of disjunctions are kept, as they cannot be dropped without changing the guard
+            guard = guard.replace('(', '').replace(')', '')
+        guard = guard.replace(' && ', ' &&\n')
+        self.sync = intern(sync)
+        self.update = intern(update)
         self.start = start
         self.end = end
         self.weight = weight
         self.controllable = controllable
+        self.guard = guard
+        # parsed guard, if already known by whoever creates the edge
+        self._constraint = constraint
+
+    @property
+    def guard(self):
+        return self._guard
+
+    @guard.setter
+    def guard(self, guard: str):
+        # the hash only needs recomputing when the guard is rewritten
+        self._guard = intern(guard)
+        self._constraint = None
+        self._hash = hash(self.key())
+
+    @property
+    def constraint(self) -> Guard:
+        # the guard string is only parsed once, on first use
+        if self._constraint is None:
+            self._constraint = Guard.parse(self._guard)
+        return self._constraint
+
+    @constraint.setter
+    def constraint(self, constraint: Guard):
+        self.guard = str(constraint).replace(' && ', ' &&\n')
+        self._constraint = constraint
+
+    def key(self):
+        return self._guard, self.sync, self.update, self.start.label, self.end.label
+
+    def __getstate__(self):
+        # the parsed guard is kept, as its discrete variables cannot be recovered from the guard string
+        return self._guard, self.sync, self.update, self.start, self.end, self.weight, self.controllable, \
+            self._constraint
+
+    def __setstate__(self, state):
+        # __init__ is bypassed, as it would rewrite the guard
+        guard, sync, update, self.start, self.end, self.weight, self.controllable, constraint = state
+        self.sync = intern(sync)
+        self.update = intern(update)
+        self.guard = guard
+        self._constraint = constraint
 
     def __str__(self):
         return self.guard + ' ' + self.sync + ' { ' + self.update + ' } ' + self.start.label + '->' + self.end.label
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        return self._hash == other._hash and self.key() == other.key()
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
 
 class BranchPoint:
+    __slots__ = ('id', 'label', '_hash')
     kind = 'BP'
 
     def __init__(self, id: str):
-        self.id = id
-        self.label = id
+        self.id = intern(id)
+        self.label = self.id
+        self._hash = hash(self.label)
+
+    def __getstate__(self):
+        return self.id
+
+    def __setstate__(self, state):
+        self.__init__(state)
 
     def __eq__(self, other):
         return self.label == other.label
@@ -136,7 +219,7 @@ class BranchPoint:
         return self.label
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
 
 class PTA:
@@ -148,6 +231,38 @@ class PTA:
         self.branchpoints = bps if bps is not None else []
         self.declarations = declarations
 
+    @property
+    def edges(self):
+        return self._edges
+
+    @edges.setter
+    def edges(self, edges: List[Edge]):
+        # forward/backward adjacency indexes keyed by location (or branchpoint) label
+        self._edges = list(edges)
+        self.out_edges: Dict[str, List[Edge]] = dict()
+        self.in_edges: Dict[str, List[Edge]] = dict()
+        for e in self._edges:
+            self.__index_edge(e)
+
+    def __index_edge(self, e: Edge):
+        self.out_edges.setdefault(e.start.label, []).append(e)
+        self.in_edges.setdefault(e.end.label, []).append(e)
+
+    def add_edge(self, e: Edge):
+        self._edges.append(e)
+        self.__index_edge(e)
+
+    def remove_edge(self, e: Edge):
+        self._edges.remove(e)
+        self.out_edges[e.start.label].remove(e)
+        self.in_edges[e.end.label].remove(e)
+
+    def successors(self, label: str):
+        return [e.end for e in self.out_edges.get(label, [])]
+
+    def predecessors(self, label: str):
+        return [e.start for e in self.in_edges.get(label, [])]
+
     @staticmethod
     def fix_label_for_html(s: str, color=None):
         if s == '':
@@ -160,52 +275,132 @@ class PTA:
             res = '<font color=\'{}\'>'.format(color) + res + '</font>'
         return res
 
-    def to_digraph(self):
+    @staticmethod
+    def summarize_guards(guards: List[str]):
+        # few guards are shown in full, otherwise only the values taken by discrete variables are listed
+        if len(guards) <= MAX_PLOTTED_GUARDS:
+            return '\n||\n'.join(guards)
+
+        values: Dict[str, Set[str]] = dict()
+        for g in guards:
+            for c in g.split('&&'):
+                fields = c.strip().split('==')
+                if len(fields) == 2:
+                    values.setdefault(fields[0], set()).add(fields[1])
+        res = ''
+        for var in sorted(values):
+            var_values = sorted(values[var], key=lambda v: (len(v), v))
+            if len(var_values) > MAX_PLOTTED_VALUES:
+                var_values = var_values[:MAX_PLOTTED_VALUES] + ['...']
+            res += '{} in {{{}}}\n'.format(var, ','.join(var_values))
+        return res + '({} guards)'.format(len(guards))
+
+    def summarize_edges(self):
+        # parallel edges (same start and end) are collapsed into a single group
+        groups: Dict[Tuple[str, str], List[Edge]] = dict()
+        for e in self.edges:
+            groups.setdefault((e.start.label, e.end.label), []).append(e)
+        return groups
+
+    def bfs_ranks(self):
+        roots = [l.label for l in self.locations if l.initial]
+        ranks: Dict[str, int] = {r: 0 for r in roots}
+        to_visit = list(roots)
+        for label in to_visit:
+            for succ in self.successors(label):
+                if succ.label not in ranks:
+                    ranks[succ.label] = ranks[label] + 1
+                    to_visit.append(succ.label)
+        return ranks
+
+    def to_digraph(self, max_edges: int = None):
+        # graphviz is only imported when plotting
+        from graphviz import Digraph
+
         GREEN = '#3a9e05'
         RED = '#ad0900'
         BLUE = 'blue'
         PURPLE = '#ba03fc'
 
+        if max_edges is None:
+            max_edges = get_config()['PTA CONFIGURATION'].getint('PLOT_MAX_EDGES', fallback=500)
+
         gra = Digraph(self.name)
 
+        groups = self.summarize_edges()
+        # labels of the nodes to plot, None for all of them
+        shown: Set[str] = None
+        if len(groups) > max_edges:
+            # edges closest to the initial location are kept
+            ranks = self.bfs_ranks()
+            kept = sorted(groups, key=lambda k: ranks.get(k[0], len(ranks)))[:max_edges]
+            LOGGER.warn('PTA plot limited to {}/{} edge groups.'.format(max_edges, len(groups)))
+            gra.attr(label='{} more edge groups not shown'.format(len(groups) - max_edges))
+            groups = {k: groups[k] for k in kept}
+            # only the locations and branchpoints the kept edges touch are plotted
+            shown = set([label for k in kept for label in k])
+
+        # locations are clustered by template
+        clusters: Dict[str, List[str]] = dict()
+        templates: Dict[str, str] = dict()
         for l in self.locations:
+            tplt = ','.join([n.tplt for n in l.net_locs])
+            templates[l.label] = tplt
+            if shown is not None and l.label not in shown:
+                continue
+            clusters.setdefault(tplt, [])
+
             invariant = PTA.fix_label_for_html(l.invariant, PURPLE)
             if l.urgent > 0:
                 urgency_label = '(U) ' if l.urgent == 1 else '(C) '
             else:
                 urgency_label = ''
             label = "<" + urgency_label + l.label + "<BR/>" + invariant + ">"
+            clusters[tplt].append((l.label, label, {'peripheries': '2'} if l.initial else {}))
 
-            if l.initial:
-                gra.node(l.label, label=label, _attributes={'peripheries': '2'})
-            else:
-                gra.node(l.label, label=label)
-
-        for i, e in enumerate(self.edges):
-            # TODO: main issue, strategy explodes
-            if i > 30:
-                LOGGER.warn('PTA partially plotted due to excessive size.')
-                break
-
-            guard = PTA.fix_label_for_html(e.guard, GREEN)
-            sync = PTA.fix_label_for_html(e.sync, RED)
-            update = PTA.fix_label_for_html(e.update, BLUE)
+        for bp in self.branchpoints:
+            if shown is not None and bp.label not in shown:
+                continue
+            # branchpoints belong to the template of the location leading to them
+            preds = [p.label for p in self.predecessors(bp.label) if p.label in templates]
+            tplt = templates[preds[0]] if len(preds) > 0 else ''
+            clusters.setdefault(tplt, []).append((bp.id, None, {'shape': 'point'}))
+
+        for tplt, nodes in clusters.items():
+            with gra.subgraph(name='cluster_' + tplt) as c:
+                c.attr(label=tplt)
+                for node_id, label, attrib in nodes:
+                    c.node(node_id, label=label, _attributes=attrib)
+
+        for (start, end), group in groups.items():
+            guards = list(dict.fromkeys([e.guard for e in group]))
+            guard = PTA.fix_label_for_html(PTA.summarize_guards(guards), GREEN)
+            sync = PTA.fix_label_for_html(', '.join(dict.fromkeys([e.sync for e in group if e.sync != ''])), RED)
+            update = PTA.fix_label_for_html('\n'.join(dict.fromkeys([e.update for e in group if e.update != ''])),
+                                            BLUE)
             label = "<" + guard + '<BR/>' + sync + '<BR/>' + update
             attrib = {}
-            if e.weight is not None:
-                label += "<BR/>" + str(e.weight)
+            weights = [str(e.weight) for e in group if e.weight is not None]
+            if len(weights) > 0:
+                label += "<BR/>" + ', '.join(dict.fromkeys(weights))
                 attrib['style'] = 'dashed'
+            if len(group) > 1:
+                attrib['penwidth'] = '2'
             label += ">"
-            gra.edge(e.start.label, e.end.label, label=label, _attributes=attrib)
-
-        for bp in self.branchpoints:
-            gra.node(bp.id, _attributes={'shape': 'point'})
+            gra.edge(start, end, label=label, _attributes=attrib)
 
         return gra
 
-    def plot(self):
-        OUT_PATH = config['PTA CONFIGURATION']['SAVE_PATH']
-        self.to_digraph().render(directory=OUT_PATH, view=True)
+    @staticmethod
+    def render_digraph(gra, fmt: str = 'pdf', view: bool = False):
+        # fmt is either a graphviz output format (e.g., svg, pdf) or 'dot' to only save the source
+        OUT_PATH = get_config()['PTA CONFIGURATION']['SAVE_PATH']
+        if fmt == 'dot':
+            return gra.save(directory=OUT_PATH)
+        return gra.render(directory=OUT_PATH, format=fmt, view=view)
+
+    def plot(self, fmt: str = 'pdf', view: bool = False):
+        return PTA.render_digraph(self.to_digraph(), fmt, view)
 
     @staticmethod
     def get_interval(tup):
@@ -218,50 +413,75 @@ class PTA:
                     100 * (1 - math.exp(-0.005 * T / 2)))
 
     def equalities2intervals(self):
+        from tqdm import tqdm
+
         LOGGER.info('Converting equality constraints to intervals...')
         for e in tqdm(self.edges):
-            equalities = [c.replace('\n', '') for c in e.guard.split('&&') if c.__contains__('==')]
-            inequalities = [c for c in e.guard.split('&&') if not c.__contains__('==')]
-            elems = [(eq.split('==')[0], eq.split('==')[1]) for eq in equalities]
+            equalities = e.constraint.equalities()
+            inequalities = Guard({k: b for k, b in e.constraint.bounds.items() if not set(k) & set(equalities)},
+                                 e.constraint.others).atoms()
             new_guard = ''
-            for i, tup in enumerate(elems):
+            for i, tup in enumerate(equalities.items()):
                 # FIXME
                 if tup[0] in ['h_dd', 'h_df', 'r_dd']:
                     interval = PTA.get_interval(tup)
                     new_guard += '({}<={}&&{}<={})\n'.format(interval[0], tup[0], tup[0], interval[1])
                 else:
                     new_guard += '({}=={})\n'.format(tup[0], tup[1])
-                if i < len(elems) - 1:
+                if i < len(equalities) - 1:
                     new_guard += '&&'
             if len(inequalities) > 0:
                 new_guard += '&&' + '&&'.join(inequalities) if new_guard != '' else '&&'.join(inequalities)
             e.guard = new_guard
 
-    def combine_edges(self):
+    def combine_edges(self, fingerprints: Fingerprints = None):
         LOGGER.info('Combining edges...')
-        # TODO: needs refinement
-        # already_processed = []
-        # old_edges = self.edges.copy()
-        # new_edges = []
-        # for i, edge in tqdm(enumerate(self.edges)):
-        #     if i in already_processed:
-        #         continue
-        #     eq_edges = []
-        #     for j, edge_2 in enumerate(self.edges):
-        #         if i == j or j in already_processed:
-        #             continue
-        #         same_start = edge.start.label == edge_2.start.label
-        #         same_end = edge.end.label == edge_2.end.label
-        #         same_sync = edge.sync == edge_2.sync
-        #         same_update = edge.update == edge_2.update
-        #         if same_start and same_end and same_sync and same_update:
-        #             already_processed.append(j)
-        #             eq_edges.append(edge_2)
-        #     if len(eq_edges) > 0:
-        #         guards = [e.guard for e in eq_edges + [edge]]
-        #         new_guard = guards2singleconstr(guards)
-        #         LOGGER.debug(new_guard)
-        #         new_edges.append(Edge(new_guard, edge.sync, edge.update, edge.start,
-        #                               edge.end, edge.weight, edge.controllable))
-        # new_edges += [e for i, e in enumerate(old_edges) if i not in already_processed]
-        # self.edges = new_edges
+        # single pass: edges only differing in their guard end up in the same group
+        groups: Dict[Tuple, List[Edge]] = dict()
+        for e in self.edges:
+            groups.setdefault((e.start.label, e.end.label, e.sync, e.update, e.weight, e.controllable), []).append(e)
+
+        # each distinct set of guards is only merged once
+        unions: Dict[FrozenSet[Guard], List[Guard]] = dict()
+        new_edges: List[Edge] = []
+        # edges whose guards have a non-convex union, simplified all together
+        residuals: List[Tuple[Edge, List[Guard]]] = []
+        # edges whose combined guard is not known from the previous run, with the fingerprint of their guards
+        combined: List[Tuple[Edge, bytes]] = []
+        for group in groups.values():
+            # the combined edge is a new one, as the grouped edges may be shared with the parsed network,
+            # which is reused across runs
+            first = group[0]
+            edge = Edge(first.guard, first.sync, first.update, first.start, first.end, first.weight,
+                        first.controllable, first._constraint)
+            new_edges.append(edge)
+            if fingerprints is not None:
+                fp = fingerprint(*sorted(set([e.guard for e in group])))
+                guard = fingerprints.reuse(fp)
+                if guard is not None:
+                    edge.guard = guard
+                    continue
+                combined.append((edge, fp))
+
+            guards = frozenset([e.constraint for e in group])
+            if guards not in unions:
+                unions[guards] = merge_guards(guards)
+            merged = unions[guards]
+            if len(merged) == 1:
+                edge.constraint = merged[0]
+            else:
+                # the union is not convex
+                residuals.append((edge, merged))
+
+        discrete = [frozenset().union(*[g.discrete for g in merged]) for _, merged in residuals]
+        simplified = simplify_guards([union_guards(tuple(sorted([str(g) for g in merged])), d)
+                                      for (_, merged), d in zip(residuals, discrete)], discrete)
+        for (edge, _), guard in zip(residuals, simplified):
+            edge.guard = guard
+        for edge, fp in combined:
+            fingerprints.store(fp, edge.guard)
+
+        LOGGER.debug('Combined {} edges into {} ({} distinct guard sets).'.format(
+            len(self.edges), len(new_edges), len(unions)))
+        LOGGER.debug(str(SIMPLIFIER_STATS))
+        self.edges = new_edges
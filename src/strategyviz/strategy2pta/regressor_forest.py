@@ -0,0 +1,110 @@
+from array import array
+from typing import Dict, List
+
+import numpy as np
+
+from src.strategyviz.strategy2pta.opt_strategy import Regressor, Tree
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('REGRESSOR FOREST')
+
+# node 0 is a leaf standing for the actions a regressor has no tree for
+MISSING = 0
+
+
+class RegressorForest:
+    # the regression trees of all the regressors of a strategy, flattened into node arrays:
+    # node i tests point variable feature[i] against bound[i] and continues with children[i, 0] (low)
+    # or children[i, 1] (high), leaves have an infinite bound, themselves as children and their value in value[i]
+    # roots[s, a] is the root of the tree of action a in state s (i.e., of the s-th regressor)
+    def __init__(self, actions: List[str], pointvars: List[str], roots: np.ndarray, minimize: np.ndarray,
+                 feature: np.ndarray, bound: np.ndarray, children: np.ndarray, value: np.ndarray, depth: int = None):
+        self.actions = actions
+        self.pointvars = pointvars
+        self.roots = roots
+        self.minimize = minimize
+        self.feature = feature
+        self.bound = bound
+        self.children = children
+        self.value = value
+        self.depth = depth if depth is not None else self.max_depth()
+
+    @staticmethod
+    def compile(regressors: List[Regressor], pointvars: List[str]):
+        feature = array('i', [0])
+        bound = array('d', [np.inf])
+        children = array('i', [MISSING, MISSING])
+        value = array('d', [np.nan])
+
+        def add_node(t: Tree):
+            # nodes are added in preorder, children are linked once added
+            i = len(feature)
+            if isinstance(t, tuple):
+                feature.append(t[0])
+                bound.append(t[1])
+                children.extend([MISSING, MISSING])
+                value.append(np.nan)
+                children[2 * i] = add_node(t[2])
+                children[2 * i + 1] = add_node(t[3])
+            else:
+                feature.append(0)
+                bound.append(np.inf)
+                children.extend([i, i])
+                value.append(t)
+            return i
+
+        columns: Dict[str, int] = dict()
+        for r in regressors:
+            for a in r.trees:
+                columns.setdefault(a, len(columns))
+
+        roots = np.full((len(regressors), len(columns)), MISSING, dtype=np.int32)
+        minimize = np.empty(len(regressors), dtype=bool)
+        for s, r in enumerate(regressors):
+            minimize[s] = r.minimize
+            for a, t in r.trees.items():
+                roots[s, columns[a]] = add_node(t)
+
+        forest = RegressorForest(list(columns.keys()), pointvars, roots, minimize,
+                                 np.frombuffer(feature, dtype=np.int32), np.frombuffer(bound, dtype=np.float64),
+                                 np.frombuffer(children, dtype=np.int32).reshape(-1, 2),
+                                 np.frombuffer(value, dtype=np.float64))
+        LOGGER.debug('Compiled {} trees ({} nodes, depth {}) for {} actions.'.format(
+            np.count_nonzero(roots), len(feature), forest.depth, len(columns)))
+        return forest
+
+    def max_depth(self):
+        # number of steps after which every path from a root has reached a leaf
+        depth = 0
+        nodes = np.unique(self.roots)
+        while True:
+            nodes = nodes[self.children[nodes, 0] != nodes]
+            if len(nodes) == 0:
+                return depth
+            nodes = self.children[nodes].reshape(-1)
+            depth += 1
+
+    def evaluate(self, states: np.ndarray, points: np.ndarray):
+        # value of each action (columns, as in self.actions) for each (state index, point valuation) row,
+        # NaN for the actions a state has no tree for
+        # points has one column per point variable, as in self.pointvars
+        # all arrays are flattened, as np.take on flat arrays is the fastest lookup
+        offsets = np.repeat(np.arange(len(states)) * points.shape[1], self.roots.shape[1])
+        points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1)
+        children = self.children.reshape(-1)
+        nodes = self.roots[states].reshape(-1)
+        # all trees are walked together, one level at a time: leaves loop on themselves
+        for _ in range(self.depth):
+            high = np.take(points, offsets + np.take(self.feature, nodes)) > np.take(self.bound, nodes)
+            nodes = np.take(children, 2 * nodes + high)
+        return np.take(self.value, nodes).reshape(len(states), self.roots.shape[1])
+
+    def best_actions(self, states: np.ndarray, points: np.ndarray):
+        # mask of the best actions (ties included) for each (state index, point valuation) row
+        values = self.evaluate(states, points)
+        # values are negated where the regressor maximizes
+        values = np.where(self.minimize[states][:, None], values, -values)
+        if values.shape[1] == 0:
+            return np.zeros(values.shape, dtype=bool)
+        best = np.where(np.isnan(values), np.inf, values).min(axis=1)
+        return values == best[:, None]
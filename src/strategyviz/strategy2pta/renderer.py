@@ -0,0 +1,57 @@
+import os
+from typing import List
+
+from src.strategyviz.strategy2pta.pta import PTA
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('RENDERER')
+
+# none: nothing is rendered, final: only the final PTA, all: intermediate PTAs as well
+RENDER_POLICIES = ['none', 'final', 'all']
+
+
+class Renderer:
+    def __init__(self, policy: str = None, fmt: str = None, view: bool = None, workers: int = None):
+        pta_config = get_config()['PTA CONFIGURATION']
+        self.policy = policy if policy is not None else pta_config.get('RENDER', fallback='final')
+        if self.policy not in RENDER_POLICIES:
+            LOGGER.error('Unknown rendering policy: {}.'.format(self.policy))
+            raise RuntimeError
+        self.fmt = fmt if fmt is not None else pta_config.get('RENDER_FORMAT', fallback='pdf')
+        self.view = view if view is not None else pta_config.getboolean('VIEW', fallback=False)
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.executor = None
+        self.futures = []
+
+    def renders(self, final: bool = False):
+        return self.policy == 'all' or (self.policy == 'final' and final)
+
+    def submit(self, pta: PTA, final: bool = False):
+        if not self.renders(final):
+            return
+
+        # the digraph is built right away, as the pta may be modified while dot is running
+        gra = pta.to_digraph()
+        if self.fmt == 'dot':
+            PTA.render_digraph(gra, self.fmt)
+            return
+
+        # each dot layout runs in its own subprocess, threads only wait for them
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.futures.append((pta.name, self.executor.submit(PTA.render_digraph, gra, self.fmt, self.view)))
+
+    def wait(self):
+        rendered: List[str] = []
+        for name, future in self.futures:
+            try:
+                rendered.append(future.result())
+            except Exception as e:
+                LOGGER.error('Rendering of {} failed: {}'.format(name, e))
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.futures = []
+        return rendered
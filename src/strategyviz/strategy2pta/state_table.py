@@ -0,0 +1,157 @@
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from src.strategyviz.strategy2pta.pta import State, NetLocation, StateVariable
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('STATE TABLE')
+
+LOC_COLUMN = '{}.location'
+# codes are 64-bit: UPPAAL integers are 32-bit, hence no value can be taken for the code of a column that is not
+# part of a state; values not fitting in 64 bits raise OverflowError rather than wrapping around
+MISSING = -2 ** 63
+
+
+class SymbolTable:
+    # bidirectional str<->int encoding of the values of a column
+    def __init__(self, symbols: Dict[str, int] = None):
+        self.codes: Dict[str, int] = dict(symbols) if symbols is not None else dict()
+        self.symbols: Dict[int, str] = {c: s for s, c in self.codes.items()}
+
+    @staticmethod
+    def from_location_names(names: Dict[str, str]):
+        # Stratego 'locationnames' entries map the location index to its name
+        return SymbolTable({name: int(i) for i, name in names.items()})
+
+    def encode(self, symbol: str):
+        try:
+            return self.codes[symbol]
+        except KeyError:
+            code = max(self.symbols.keys(), default=-1) + 1
+            self.codes[symbol] = code
+            self.symbols[code] = symbol
+            return code
+
+    def decode(self, code: int):
+        return self.symbols[code]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class StateTable:
+    # columnar, integer-encoded table of discrete states:
+    # one column per template location (encoded through a SymbolTable) and one per state variable,
+    # row i is the i-th state the table was built from
+    def __init__(self, columns: List[str], data: np.ndarray, symbols: Dict[str, SymbolTable]):
+        self.columns = columns
+        self.data = data
+        self.symbols = symbols
+        self.index = {c: i for i, c in enumerate(columns)}
+
+    @staticmethod
+    def from_states(states: Iterable[State], symbols: Dict[str, SymbolTable] = None):
+        symbols = dict(symbols) if symbols is not None else dict()
+        columns: List[str] = []
+        values: Dict[str, array] = dict()
+
+        n_rows = 0
+        for s in states:
+            row: List[Tuple[str, int]] = []
+            for l in s.locs:
+                col = LOC_COLUMN.format(l.tplt)
+                row.append((col, symbols.setdefault(col, SymbolTable()).encode(l.label)))
+            for v in s.vars:
+                row.append((v.identifier, int(v.value)))
+
+            for col, code in row:
+                if col not in values:
+                    # columns appearing later are backfilled for previous rows
+                    columns.append(col)
+                    values[col] = array('q', [MISSING] * n_rows)
+                values[col].append(code)
+            n_rows += 1
+            for col in columns:
+                if len(values[col]) < n_rows:
+                    values[col].append(MISSING)
+
+        data = np.empty((n_rows, len(columns)), dtype=np.int64)
+        for i, col in enumerate(columns):
+            data[:, i] = np.frombuffer(values[col], dtype=np.int64) if n_rows > 0 else []
+
+        LOGGER.debug('Encoded {} states over {} columns.'.format(n_rows, len(columns)))
+        return StateTable(columns, data, symbols)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def column(self, name: str):
+        return self.data[:, self.index[name]]
+
+    def encode(self, column: str, value):
+        if column in self.symbols:
+            return self.symbols[column].codes.get(value, MISSING)
+        else:
+            return int(value)
+
+    def where(self, conditions: Dict[str, object]):
+        # boolean mask of the rows matching all column==value conditions
+        mask = np.ones(len(self), dtype=bool)
+        for col, value in conditions.items():
+            mask &= self.column(col) == self.encode(col, value)
+        return mask
+
+    def select(self, mask: np.ndarray):
+        return StateTable(self.columns, self.data[mask], self.symbols)
+
+    def project(self, columns: List[str]):
+        return StateTable(columns, self.data[:, [self.index[c] for c in columns]],
+                          {c: s for c, s in self.symbols.items() if c in columns})
+
+    def group_by(self, columns: List[str]):
+        # returns the distinct (encoded) groups and, for each row, the index of its group
+        groups, inverse = np.unique(self.data[:, [self.index[c] for c in columns]], axis=0, return_inverse=True)
+        return StateTable(columns, groups, {c: s for c, s in self.symbols.items() if c in columns}), \
+            inverse.reshape(-1)
+
+    def recode(self, column: str, other: 'StateTable'):
+        # codes of other's column, translated to this table's symbols
+        codes = other.column(column)
+        if column not in self.symbols or self.symbols[column] is other.symbols[column]:
+            return codes
+        mapping = np.full(max(other.symbols[column].symbols.keys(), default=0) + 1, MISSING, dtype=np.int64)
+        for symbol, code in other.symbols[column].codes.items():
+            mapping[code] = self.symbols[column].codes.get(symbol, MISSING)
+        return np.where(codes == MISSING, MISSING, mapping[np.where(codes == MISSING, 0, codes)])
+
+    def join(self, other: 'StateTable', on: List[str]):
+        # equi-join on the given columns: returns the pairs (i, j) of matching row indexes
+        left = self.data[:, [self.index[c] for c in on]]
+        right = np.stack([self.recode(c, other) for c in on], axis=1).astype(np.int64)
+        _, ids = np.unique(np.concatenate([left, right]), axis=0, return_inverse=True)
+        ids = ids.reshape(-1)
+        left_ids, right_ids = ids[:len(left)], ids[len(left):]
+
+        order = np.argsort(right_ids, kind='stable')
+        sorted_right = right_ids[order]
+        starts = np.searchsorted(sorted_right, left_ids, side='left')
+        counts = np.searchsorted(sorted_right, left_ids, side='right') - starts
+
+        left_rows = np.repeat(np.arange(len(left)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        right_rows = order[np.repeat(starts, counts) + offsets]
+        return left_rows, right_rows
+
+    def decode(self, row: int):
+        locs: List[NetLocation] = []
+        state_vars: List[StateVariable] = []
+        for col, code in zip(self.columns, self.data[row]):
+            if code == MISSING:
+                continue
+            if col in self.symbols:
+                locs.append(NetLocation(col.split('.')[0], self.symbols[col].decode(int(code))))
+            else:
+                state_vars.append(StateVariable(col, str(code)))
+        return State(locs, state_vars)
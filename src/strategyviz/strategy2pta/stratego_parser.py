@@ -1,25 +1,123 @@
 import json
-from typing import List
+import re
+from typing import Dict, Iterator, TextIO
 
+from src.strategyviz.parse_cache.fingerprints import Fingerprints, fingerprint
 from src.strategyviz.strategy2pta.opt_strategy import OptimizedStrategy, Regressor
 from src.strategyviz.viz_logging.logger import Logger
 
 LOGGER = Logger('STRATEGO PARSER')
 
+# characters read from the strategy file at a time
+CHUNK_SIZE = 1 << 16
+# top-level values the regressors are parsed against
+HEADER_KEYS = ['statevars', 'locationnames', 'actions']
+WHITESPACE = re.compile(r'[ \t\n\r]*')
 
-def parse_optimized_strategy(name: str, data: str):
-    json_content = json.loads(data)
 
-    regressors_dict = json_content['regressors']
-    regressors: List[Regressor] = []
-    state_vars = json_content['statevars']
-    locationnames = json_content['locationnames']
-    actions = json_content['actions']
+class JsonStream:
+    # reads a JSON document one value at a time: only the value being read
+    # (and what is left of the last chunk) is ever kept in memory
+    def __init__(self, file_obj: TextIO):
+        self.file_obj = file_obj
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
 
-    for state_str in regressors_dict:
-        new_regressors = Regressor.parse(state_str, regressors_dict[state_str], state_vars, locationnames, actions)
-        regressors.extend(new_regressors)
+    def fill(self):
+        # drops what has already been read, at least doubling what is left when a value spans many chunks
+        chunk = self.file_obj.read(max(CHUNK_SIZE, len(self.buf) - self.pos))
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = len(chunk) == 0
 
-    LOGGER.info('Found {} regressors.'.format(len(regressors)))
+    def peek(self):
+        # next non-whitespace character, '' at the end of the document
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self.fill()
 
-    return OptimizedStrategy(name, regressors)
+    def expect(self, chars: str):
+        c = self.peek()
+        if c == '' or c not in chars:
+            LOGGER.error("Invalid JSON: expected one of '{}', found '{}'.".format(chars, c))
+            raise RuntimeError
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                # the value may be incomplete
+                if self.eof:
+                    raise
+            self.fill()
+
+    def members(self) -> Iterator[str]:
+        # keys of the object starting at the current position, the value of each key must be read by the caller
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+
+def parse_optimized_strategy(name: str, file_obj: TextIO, fingerprints: Fingerprints = None):
+    # regressors are parsed and indexed one entry at a time, while reading the file
+    stream = JsonStream(file_obj)
+    header: Dict = dict()
+    optimized_strategy = None
+    for key in stream.members():
+        if key != 'regressors':
+            header[key] = stream.value()
+            continue
+
+        # Stratego writes the header before the regressors
+        missing = [k for k in HEADER_KEYS if k not in header]
+        if len(missing) > 0:
+            LOGGER.error('Missing {} before the regressors of {}.'.format(', '.join(missing), name))
+            raise RuntimeError
+        state_vars = header['statevars']
+        locationnames = header['locationnames']
+        actions = header['actions']
+        optimized_strategy = OptimizedStrategy(name, [], locationnames, header.get('pointvars'))
+
+        if fingerprints is not None:
+            # regressors are parsed against the state variables, locations and actions of the strategy
+            context = fingerprint(json.dumps([state_vars, locationnames, actions], sort_keys=True))
+        for state_str in stream.members():
+            entry = stream.value()
+            if fingerprints is not None:
+                fp = context + fingerprint(state_str, json.dumps(entry, sort_keys=True))
+                # unchanged entries are not parsed again
+                new_regressors = fingerprints.reuse(fp)
+                if new_regressors is None:
+                    new_regressors = Regressor.parse(state_str, entry, state_vars, locationnames, actions)
+                    fingerprints.store(fp, new_regressors)
+            else:
+                new_regressors = Regressor.parse(state_str, entry, state_vars, locationnames, actions)
+            for r in new_regressors:
+                optimized_strategy.add(r)
+
+    if optimized_strategy is None:
+        LOGGER.error('No regressors found in {}.'.format(name))
+        raise RuntimeError
+
+    LOGGER.info('Found {} regressors.'.format(len(optimized_strategy.regressors)))
+
+    return optimized_strategy
@@ -1,14 +1,15 @@
-from typing import List, Set
+from typing import Dict, Iterable, List, Set, Tuple
 
-from tqdm import tqdm
-
-from src.strategyviz.strategy2pta.pta import PTA, Location, State, StateVariable, NetLocation, Edge
+from src.strategyviz.parse_cache.fingerprints import Fingerprints, fingerprint
+from src.strategyviz.strategy2pta.guard import Guard, parenthesize
+from src.strategyviz.strategy2pta.pta import PTA, Location, State, StateVariable, NetLocation, Edge, intern
 from src.strategyviz.viz_logging.logger import Logger
 
 LOGGER = Logger('TIGA STRATEGY')
 
 
 class TigaState:
+    __slots__ = ('state',)
     opener = 'State: '
     str_format = '{}{}'
 
@@ -26,20 +27,21 @@ class TigaState:
 
         ext_locs_str = fields[1].split(')')[0].replace('(', '').split(' ')
         ext_locs_str = list(filter(lambda s: len(s) > 0, ext_locs_str))
-        # TODO: experimental, only keep pta to disambiguate
-        ext_locs = [NetLocation.parse(s) for s in ext_locs_str][0]
+        # one location per automaton of the network
+        ext_locs = [NetLocation.parse(s) for s in ext_locs_str]
 
         state_vars_str = fields[1].split(')')[1].split(' ')
         state_vars_str = list(filter(lambda s: s.__contains__('='), state_vars_str))
         state_vars = [StateVariable.parse(s) for s in state_vars_str]
 
-        return TigaState(State([ext_locs], state_vars))
+        return TigaState(State(ext_locs, state_vars))
 
     def __str__(self):
         return self.str_format.format(self.opener, self.state)
 
 
 class TigaEdge:
+    __slots__ = ('guard', 'sync', 'update', 'next_state', 'movers', 'transition')
     opener = 'When you are in '
     middle = ', take transition '
     str_format = '{}{}{}{}'
@@ -47,11 +49,16 @@ class TigaEdge:
     # E.g.
     # When you are in (time<=15 && T<=2 && T-time<-3), take transition Kim.GoBack->Kim.Aalborg { 1, tau, 1 }
     # When you are in (6<time && time<=15 && T<=2), take transition Kim.Wait->Kim.GoBack { 1, tau, T := 0, retry := 1 }
-    def __init__(self, guard: str, sync: str, update: str, next_state: State):
-        self.guard = guard
-        self.sync = sync
-        self.update = update
+    def __init__(self, guard: str, sync: str, update: str, next_state: State, movers: List[str] = None,
+                 transition: str = ''):
+        self.guard = intern(guard)
+        self.sync = intern(sync)
+        self.update = intern(update)
         self.next_state = next_state
+        # automata taking the transition (more than one if synchronizing)
+        self.movers = movers if movers is not None else [l.tplt for l in next_state.locs[:1]]
+        # as labelled by Stratego actions, e.g., Kim.Wait->Kim.GoBack { 1, tau, T := 0, retry := 1 }
+        self.transition = intern(transition)
 
     @classmethod
     def parse(cls, line: str, curr_state: TigaState):
@@ -71,10 +78,10 @@ class TigaEdge:
         update = [u for u in update if u.__contains__('=')]
         update = ','.join(update)
 
-        next_loc_str = next_str.split(' {')[0].split('->')[1]
-
-        next_loc = NetLocation(next_loc_str.split('.')[0], next_loc_str.split('.')[1])
-        next_locs = [next_loc]
+        # e.g., Kim.Wait->Kim.GoBack, or one such transition per synchronizing automaton
+        transitions = [t for t in next_str.split(' {')[0].split(' ') if t.__contains__('->')]
+        next_locs = [NetLocation.parse(t.split('->')[1]) for t in transitions]
+        movers = [intern(l.tplt) for l in next_locs]
         # TODO: hard-coded, just for demo purposes
         # if next_loc.label == 'moving':
         #     next_locs.append(NetLocation('h', 'walk'))
@@ -100,13 +107,14 @@ class TigaEdge:
         # TODO: the strategy only contains the destination location for the automaton making the transition
         # but it is possible that such transition causes other automata to switch as well (e.g., through channels),
         # and these should be calculated as well
-        return TigaEdge(guard, sync, update, State(next_locs, next_vars))
+        return TigaEdge(guard, sync, update, State(next_locs, next_vars), movers, next_str.strip())
 
     def __str__(self):
         return self.str_format.format(self.opener, self.guard, self.middle, self.next_state)
 
 
 class TigaWait:
+    __slots__ = ('guard',)
     opener = 'While you are in\t'
     end = ', wait.'
     str_format = '{}{}{}'
@@ -129,6 +137,7 @@ class TigaWait:
 
 
 class TigaBlock:
+    __slots__ = ('state', 'edges', 'wait')
     # E.g.
     # State: ( Kim.GoBack ) retry=1
     # When you are in (time<=15 && T<=2 && T-time<-3), take transition Kim.GoBack->Kim.Aalborg { 1, tau, 1 }
@@ -170,61 +179,155 @@ class TigaBlock:
         return res + '\n'
 
 
+# projection of a block on a single automaton:
+# location of the automaton, whether the automaton waits, edges taken by the automaton
+ProjectedBlock = Tuple[Location, bool, List[Edge]]
+
+
+def project_block(block: TigaBlock, instances: Iterable[str], initial_locs: List[NetLocation]):
+    state = block.state.state
+    projections: Dict[str, ProjectedBlock] = dict()
+    for l in state.locs:
+        if l.tplt not in instances:
+            continue
+
+        curr_loc = Location([l], l in initial_locs)
+        edges: List[Edge] = []
+        for e in block.edges:
+            if l.tplt not in e.movers:
+                continue
+            new_guard = ''
+            for v in state.vars:
+                new_guard += str(v) + '&&\n'
+            new_guard = new_guard + parenthesize(e.guard)
+            # state variables are discrete, the guard of the TIGA edge is a zone on the clocks
+            constraint = Guard.from_equalities([(v.identifier, v.value) for v in state.vars]) \
+                .conjoin(Guard.parse(e.guard))
+            next_locs = [n for n in e.next_state.locs if n.tplt == l.tplt]
+            edges.append(Edge(new_guard, e.sync, e.update, curr_loc, Location(next_locs), constraint=constraint))
+        projections[l.tplt] = (curr_loc, len(block.edges) == 0, edges)
+    return projections
+
+
+def project(name: str, net_pta: PTA, blocks: List[ProjectedBlock]):
+    # PTA of a single automaton of the network, restricted to the strategy
+    # net_locations is a label->location index, edges are looked up through the pta adjacency indexes
+    net_locations: Dict[str, Location] = {l.label: l for l in net_pta.locations}
+
+    locations: Set[Location] = set()
+    edges: Set[Edge] = set()
+    for curr_loc, wait, block_edges in blocks:
+        net_loc = net_locations[curr_loc.label]
+        curr_loc.invariant = net_loc.invariant
+        curr_loc.urgent = net_loc.urgent
+        locations.add(curr_loc)
+
+        if wait:
+            edges.update(net_pta.out_edges.get(curr_loc.label, []))
+        edges.update(block_edges)
+
+    for other_l in net_pta.locations:
+        if other_l not in locations:
+            adjacent_edges = net_pta.out_edges.get(other_l.label, []) + net_pta.in_edges.get(other_l.label, [])
+            for other_e in adjacent_edges:
+                if other_e.controllable:
+                    continue
+                else:
+                    locations.add(other_l)
+                    edges.add(other_e)
+
+    for other_e in net_pta.edges:
+        if not other_e.controllable and other_e not in edges \
+                and other_e.start in locations and other_e.end in locations:
+            edges.add(other_e)
+
+    for bp in net_pta.branchpoints:
+        edges.update(net_pta.out_edges.get(bp.label, []))
+
+    return PTA(name, list(locations), list(edges), net_pta.branchpoints, net_pta.declarations)
+
+
 class TigaStrategy:
-    def __init__(self, name: str, blocks: List[TigaBlock], initial_state: State):
+    def __init__(self, name: str, blocks: Iterable[TigaBlock], initial_state: State, fingerprinted: bool = False):
         self.name = name
+        # blocks may be a generator (see tigaparser.iter_tiga_blocks), consumed once by to_ptas;
+        # fingerprinted blocks are (fingerprint, lines) pairs, only parsed if their projection is not known yet
         self.blocks = blocks
         self.initial_state = initial_state
+        self.fingerprinted = fingerprinted
+
+    def project_blocks(self, instances: List[str], fingerprints: Fingerprints = None):
+        # single pass over the blocks, splitting each of them among the automata it involves
+        projections: Dict[str, List[ProjectedBlock]] = {i: [] for i in instances}
+        controlled: Set[str] = set()
+        # projections of the same block differ if the network does
+        context = fingerprint(*instances, *[str(l) for l in self.initial_state.locs])
+        for b in self.blocks:
+            if self.fingerprinted:
+                fp, lines = b
+                fp = context + fp
+                # unchanged blocks are neither parsed nor projected again
+                block_projections = fingerprints.reuse(fp) if fingerprints is not None else None
+                if block_projections is None:
+                    try:
+                        block_projections = project_block(TigaBlock.parse(lines), projections.keys(),
+                                                          self.initial_state.locs)
+                    except ValueError:
+                        LOGGER.error("Invalid TIGA strategy block: {}".format(lines[0].strip()))
+                        block_projections = dict()
+                    if fingerprints is not None:
+                        fingerprints.store(fp, block_projections)
+            else:
+                block_projections = project_block(b, projections.keys(), self.initial_state.locs)
+
+            for i, (loc, wait, edges) in block_projections.items():
+                projections[i].append((loc, wait, edges))
+                if len(edges) > 0:
+                    controlled.add(i)
+        return projections, controlled
+
+    def state_table(self):
+        # block states as a NumPy-backed table (numpy is only needed here), row i is the state of the i-th block;
+        # blocks still to be read from the strategy file are read (and kept for to_ptas)
+        from src.strategyviz.strategy2pta.state_table import StateTable
+
+        self.blocks = list(self.blocks)
+        if self.fingerprinted:
+            states = [TigaState.parse(lines[0]).state for _, lines in self.blocks]
+        else:
+            states = [b.state.state for b in self.blocks]
+        return StateTable.from_states(states)
+
+    def to_ptas(self, network: List[PTA], workers: int = 1, fingerprints: Fingerprints = None):
+        from tqdm import tqdm
 
-    def to_pta(self, network: List[PTA], view=False):
         LOGGER.info('Converting TIGA strategy to TA...')
 
-        locations: Set[Location] = set()
-        edges: Set[Edge] = set()
-        for b in tqdm(self.blocks):
-            curr_loc = Location(b.state.state.locs, len(set(b.state.state.locs) - set(self.initial_state.locs)) == 0)
-            curr_invariant = list(filter(lambda l: l.label == curr_loc.label, network[0].locations))[0].invariant
-            curr_loc.invariant = curr_invariant
-            curr_urgency = list(filter(lambda l: l.label == curr_loc.label, network[0].locations))[0].urgent
-            curr_loc.urgent = curr_urgency
-            locations.add(curr_loc)
-
-            if len(b.edges) == 0:
-                external_pta: PTA = network[0]
-                edges.update(set(filter(lambda e: e.start.label == curr_loc.label, external_pta.edges)))
-
-            for e in b.edges:
-                new_guard = ''
-                for v in b.state.state.vars:
-                    new_guard += str(v) + '&&\n'
-                new_guard = new_guard + e.guard
-                edges.add(Edge(new_guard, e.sync, e.update, curr_loc, Location(e.next_state.locs)))
-
-        for other_l in network[0].locations:
-            if other_l not in locations:
-                for other_e in network[0].edges:
-                    if other_l.label in [other_e.start.label, other_e.end.label]:
-                        if other_e.controllable:
-                            continue
-                        else:
-                            locations.add(other_l)
-                            edges.add(other_e)
-
-        for other_e in network[0].edges:
-            if not other_e.controllable and other_e not in edges \
-                    and other_e.start in locations and other_e.end in locations:
-                edges.add(other_e)
-
-        # TODO Clearly, it only works if there is only one pta in the network
-        # (or, at least, if there is only one with controllable edges)
-        bps_ids = [bp.label for bp in network[0].branchpoints]
-        edges_from_bps = list(filter(lambda e: e.start.label in bps_ids, network[0].edges))
-        edges.update(edges_from_bps)
-
-        pta = PTA(self.name, list(locations), list(edges), network[0].branchpoints, network[0].declarations)
+        # instance name->pta index
+        net_ptas: Dict[str, PTA] = {pta.name: pta for pta in network}
+        projections, controlled = self.project_blocks(list(net_ptas.keys()), fingerprints)
+        # only the automata whose edges are chosen by the strategy are projected
+        instances = [i for i in net_ptas if i in controlled]
+        if len(instances) == 0:
+            instances = [network[0].name]
+        names = [self.name if len(instances) == 1 else '{}_{}'.format(self.name, i) for i in instances]
+        args = [(n, net_ptas[i], projections[i]) for n, i in zip(names, instances)]
+
+        if workers > 1 and len(instances) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            # projections are independent of each other
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                ptas = list(executor.map(project, *zip(*args)))
+        else:
+            ptas = [project(*a) for a in tqdm(args)]
+
+        LOGGER.info('{} TA successfully created.'.format(len(ptas)))
+        return ptas
 
+    def to_pta(self, network: List[PTA], view=False):
+        # projection on the first automaton controlled by the strategy
+        pta = self.to_ptas(network)[0]
         if view:
             pta.plot()
-
-        LOGGER.info('TA successfully created.')
         return pta
@@ -1,36 +1,159 @@
-from typing import List
-
-from tqdm import tqdm
+import os
+from typing import Iterable, Iterator, List, Tuple
 
+from src.strategyviz.parse_cache.fingerprints import fingerprint
 from src.strategyviz.strategy2pta.pta import State, StateVariable, NetLocation
 from src.strategyviz.strategy2pta.tiga_strategy import TigaBlock, TigaStrategy
 from src.strategyviz.viz_logging.logger import Logger
 
 LOGGER = Logger('TIGA PARSER')
 
+INITIAL_STATE_OPENER = 'Initial state:'
+STRATEGY_OPENER = 'Strategy to'
+# more chunks than workers, so that slower chunks do not stall the pool
+CHUNKS_PER_WORKER = 4
+
 
-def parse_tiga_strategy(name: str, file_content: List[str]):
-    initial_str = file_content[file_content.index('Initial state:\n') + 1]
+def parse_initial_state(initial_str: str):
     initial_locs_str = initial_str.split(' ) ')[0].replace('( ', '').split(' ')
     initial_locs = [NetLocation(s.split('.')[0], s.split('.')[1]) for s in initial_locs_str]
     initial_vars_str = initial_str.split(' ) ')[1].replace(' \n', '').split(' ')
     initial_vars = [StateVariable(s.split('=')[0], s.split('=')[1]) for s in initial_vars_str]
-    initial_state = State(initial_locs, initial_vars)
-
-    start_index = [i for i, line in enumerate(file_content) if line.__contains__('Strategy to')][0]
-    block_lines = file_content[start_index + 1:]
-    str_blocks = []
-    for line in block_lines:
-        if line == '\n':
-            str_blocks.append([])
+    return State(initial_locs, initial_vars)
+
+
+def iter_block_lines(lines: Iterable[str]) -> Iterator[List[str]]:
+    # groups lines into blocks separated by blank (or whitespace-only) lines
+    block_lines: List[str] = []
+    for line in lines:
+        if line.strip() == '':
+            if len(block_lines) > 0:
+                yield block_lines
+            block_lines = []
         else:
-            str_blocks[-1].append(line)
+            block_lines.append(line)
+
+    if len(block_lines) > 0:
+        yield block_lines
+
+
+def iter_strategy_lines(file_obj: Iterable[str]) -> Iterator[str]:
+    # lines following the strategy opener, which is looked for right away
+    lines = iter(file_obj)
+    for line in lines:
+        if line.__contains__(STRATEGY_OPENER):
+            return lines
+    LOGGER.error('No \'{}\' line found in the TIGA strategy.'.format(STRATEGY_OPENER))
+    raise ValueError
+
 
-    blocks = []
-    for block in tqdm(str_blocks):
+def parse_blocks(lines: Iterable[str]) -> Iterator[TigaBlock]:
+    # lines are consumed one at a time: a block is parsed and yielded as soon as the blank line closing it is read
+    for block_lines in iter_block_lines(lines):
         try:
-            blocks.append(TigaBlock.parse(block))
+            yield TigaBlock.parse(block_lines)
         except ValueError:
-            LOGGER.error("An error occurred while parsing the TIGA strategy.")
+            LOGGER.error("Invalid TIGA strategy block: {}".format(block_lines[0].strip()))
+
+
+def iter_tiga_blocks(file_obj: Iterable[str]) -> Iterator[TigaBlock]:
+    # file_obj may be positioned anywhere before the strategy opener: the opener is looked for right away,
+    # the blocks following it only as they are consumed
+    return parse_blocks(iter_strategy_lines(file_obj))
+
+
+def fingerprint_blocks(lines: Iterable[str]) -> Iterator[Tuple[bytes, List[str]]]:
+    # blocks are not parsed here: the projection of unchanged blocks is known from the previous run
+    for block_lines in iter_block_lines(lines):
+        yield fingerprint(''.join(block_lines)), block_lines
+
+
+def iter_fingerprinted_blocks(file_obj: Iterable[str]) -> Iterator[Tuple[bytes, List[str]]]:
+    # as iter_tiga_blocks
+    return fingerprint_blocks(iter_strategy_lines(file_obj))
+
+
+def split_in_chunks(path: str, n_chunks: int) -> List[Tuple[int, int]]:
+    # splits the strategy section of the file into byte ranges,
+    # each one starting right after a blank line (i.e., at the beginning of a block)
+    with open(path, 'rb') as f:
+        line = f.readline()
+        while line and not line.__contains__(STRATEGY_OPENER.encode()):
+            line = f.readline()
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+
+        chunk_size = max(1, (size - start) // n_chunks)
+        boundaries = [start]
+        while boundaries[-1] < size:
+            f.seek(min(boundaries[-1] + chunk_size, size))
+            # completes the (possibly partial) current line, then looks for a blank one
+            f.readline()
+            line = f.readline()
+            # blank lines may end with \r\n, as in files written on Windows
+            while line and line.strip() != b'':
+                line = f.readline()
+            boundaries.append(f.tell() if line else size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_chunk(path: str, start: int, end: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        # newlines are translated as when the file is read in text mode
+        lines = f.read(end - start).decode().replace('\r\n', '\n').splitlines(keepends=True)
+
+    blocks: List[TigaBlock] = []
+    errors: List[str] = []
+    for block_lines in iter_block_lines(lines):
+        try:
+            blocks.append(TigaBlock.parse(block_lines))
+        except ValueError:
+            errors.append(block_lines[0].strip())
+
+    return blocks, errors
+
+
+def iter_tiga_blocks_parallel(path: str, workers: int) -> Iterator[TigaBlock]:
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = split_in_chunks(path, workers * CHUNKS_PER_WORKER)
+    LOGGER.debug('Parsing {} chunks with {} workers...'.format(len(chunks), workers))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_chunk, path, start, end) for start, end in chunks]
+        # results are collected in submission order, so blocks are yielded in file order
+        for i, future in enumerate(futures):
+            blocks, errors = future.result()
+            if len(errors) > 0:
+                LOGGER.error("Chunk {} (bytes {}-{}): {} invalid TIGA strategy block(s): {}"
+                             .format(i, chunks[i][0], chunks[i][1], len(errors), '; '.join(errors)))
+            yield from blocks
+
+
+def parse_tiga_strategy(name: str, file_obj: Iterable[str], workers: int = 1, fingerprinted: bool = False):
+    lines = iter(file_obj)
+    initial_str = None
+    for line in lines:
+        if line.startswith(INITIAL_STATE_OPENER):
+            initial_str = next(lines, None)
+            break
+    if initial_str is None:
+        LOGGER.error('No initial state found in the TIGA strategy.')
+        raise ValueError
+    initial_state = parse_initial_state(initial_str)
+
+    # blocks are parsed lazily while the strategy is being consumed,
+    # hence the file must stay open until then
+    if fingerprinted:
+        # hashing is cheaper than parsing, blocks are fingerprinted in this process
+        return TigaStrategy(name, iter_fingerprinted_blocks(lines), initial_state, fingerprinted=True)
+    elif workers > 1:
+        # a strategy without its opener would otherwise be taken as an empty one
+        iter_strategy_lines(lines)
+        blocks = iter_tiga_blocks_parallel(file_obj.name, workers)
+    else:
+        blocks = iter_tiga_blocks(lines)
 
     return TigaStrategy(name, blocks, initial_state)
@@ -0,0 +1,52 @@
+import argparse
+import random
+import sys
+import time
+from typing import List
+
+from src.strategyviz.strategy2pta.converter import clean_pta
+from src.strategyviz.strategy2pta.pta import PTA, BranchPoint, Edge, Location, NetLocation
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('TRIM BENCHMARK')
+
+
+def synthetic_pta(n_edges: int, seed: int = 0):
+    # a long chain from the initial location (deep enough to break a recursive visit), random edges among the
+    # reachable locations, every tenth one through a branchpoint, and an unreachable part with a third of the edges
+    rnd = random.Random(seed)
+    n_locs = max(2, n_edges // 10)
+    locs = [Location([NetLocation('Bench', 'L{}'.format(i))], initial=i == 0) for i in range(n_locs)]
+    reachable, unreachable = locs[:n_locs * 2 // 3], locs[n_locs * 2 // 3:]
+    bps: List[BranchPoint] = []
+    edges: List[Edge] = [Edge('', '', '', reachable[i], reachable[i + 1]) for i in range(len(reachable) - 1)]
+    while len(edges) < n_edges:
+        part = reachable if len(edges) < n_edges * 2 // 3 or len(unreachable) == 0 else unreachable
+        start, end = rnd.choice(part), rnd.choice(part)
+        if len(edges) % 10 == 0:
+            bps.append(BranchPoint('bp{}'.format(len(bps))))
+            edges.append(Edge('', '', '', start, bps[-1]))
+            edges.append(Edge('', '', '', bps[-1], end, weight='1'))
+        else:
+            edges.append(Edge('x >= {}'.format(len(edges) % 30), '', '', start, end))
+    return PTA('bench', locs, edges, bps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='trim_bench',
+                                     description='Checks that trimming a synthetic PTA completes within the time '
+                                                 'budget.')
+    parser.add_argument('--edges', type=int, default=100000, help='edges of the synthetic PTA')
+    parser.add_argument('--budget-s', type=float, default=5.0, help='time budget of the trimming')
+    ARGS = parser.parse_args()
+
+    PTA_IN = synthetic_pta(ARGS.edges)
+    START = time.perf_counter()
+    PTA_OUT = clean_pta(PTA_IN)
+    ELAPSED = time.perf_counter() - START
+
+    LOGGER.msg('Trimmed {} to {} edges, {} to {} locations in {:.2f}s.'.format(
+        len(PTA_IN.edges), len(PTA_OUT.edges), len(PTA_IN.locations), len(PTA_OUT.locations), ELAPSED))
+    if ELAPSED > ARGS.budget_s:
+        LOGGER.error('Trimming took {:.2f}s, over the {:.2f}s budget.'.format(ELAPSED, ARGS.budget_s))
+        sys.exit(1)
@@ -0,0 +1,280 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.strategyviz.strategy2pta.guard import ZERO
+from src.strategyviz.strategy2pta.regressor_forest import RegressorForest
+from src.strategyviz.strategy_server.index import StrategyIndex, StrategyQueries, CompiledGuard, QueryKey, \
+    key_string, query_key
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('COMPILED STRATEGY')
+
+COMPILED_EXT = '.cstrategy'
+MAGIC = b'SVIZSTRT'
+# to be increased whenever the layout of the file changes
+FORMAT_VERSION = 1
+# magic, format version, header length
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 8
+
+
+def key_hash(key: bytes):
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def hash_table(keys: List[bytes]):
+    # open addressing with linear probing, at most half full: slots hold the key hash and the key index (-1 if empty)
+    size = 1
+    while size < 2 * len(keys):
+        size *= 2
+    hashes = array('Q', [0] * size)
+    ids = array('i', [-1] * size)
+    for i, k in enumerate(keys):
+        h = key_hash(k)
+        slot = h & (size - 1)
+        while ids[slot] >= 0:
+            slot = (slot + 1) & (size - 1)
+        hashes[slot] = h
+        ids[slot] = i
+    return hashes, ids
+
+
+class StringTable:
+    def __init__(self):
+        self.ids: Dict[bytes, int] = dict()
+        self.offsets = array('q', [0])
+        self.blob = bytearray()
+
+    def add(self, s: bytes):
+        if s not in self.ids:
+            self.ids[s] = len(self.ids)
+            self.blob.extend(s)
+            self.offsets.append(len(self.blob))
+        return self.ids[s]
+
+
+def write_compiled(index: StrategyIndex, path: str):
+    # layout: preamble, JSON header (metadata and offset, type code and length of each section), sections;
+    # sections are flat arrays of fixed-size items, aligned so that they can be viewed in place
+    strings = StringTable()
+    clocks: Dict[str, int] = {ZERO: 0}
+    guards: Dict[CompiledGuard, int] = dict()
+    guard_start, conj_start = array('i', [0]), array('i', [0])
+    cx, cy, cc, cs = array('i'), array('i'), array('q'), array('B')
+
+    def add_guard(g: CompiledGuard):
+        if g not in guards:
+            guards[g] = len(guards)
+            for conjunction in g:
+                for x, y, c, strict in conjunction:
+                    cx.append(clocks.setdefault(x, len(clocks)))
+                    cy.append(clocks.setdefault(y, len(clocks)))
+                    cc.append(c)
+                    cs.append(strict)
+                conj_start.append(len(cx))
+            guard_start.append(len(conj_start) - 1)
+        return guards[g]
+
+    state_keys, edge_start, wait_guard = array('i'), array('i', [0]), array('i')
+    edge_transition, edge_guard = array('i'), array('i')
+    keys: List[bytes] = []
+    for key, entry in index.states.items():
+        keys.append(key_string(key).encode())
+        state_keys.append(strings.add(keys[-1]))
+        for t, g in entry.edges.items():
+            edge_transition.append(strings.add(t.encode()))
+            edge_guard.append(add_guard(g))
+        edge_start.append(len(edge_transition))
+        wait_guard.append(add_guard(entry.wait) if entry.wait is not None else -1)
+    state_hashes, state_ids = hash_table(keys)
+
+    row_keys: List[bytes] = [key_string(key).encode() for key in index.rows]
+    row_key_ids = array('i', [strings.add(k) for k in row_keys])
+    row_ids = array('i', index.rows.values())
+    row_hashes, row_slots = hash_table(row_keys)
+
+    sections: Dict[str, np.ndarray] = {
+        'string_offsets': np.frombuffer(strings.offsets, dtype=np.int64),
+        'strings': np.frombuffer(bytes(strings.blob), dtype=np.uint8),
+        'state_hashes': np.frombuffer(state_hashes, dtype=np.uint64),
+        'state_slots': np.frombuffer(state_ids, dtype=np.int32),
+        'state_keys': np.frombuffer(state_keys, dtype=np.int32),
+        'edge_start': np.frombuffer(edge_start, dtype=np.int32),
+        'wait_guard': np.frombuffer(wait_guard, dtype=np.int32),
+        'edge_transition': np.frombuffer(edge_transition, dtype=np.int32),
+        'edge_guard': np.frombuffer(edge_guard, dtype=np.int32),
+        'guard_start': np.frombuffer(guard_start, dtype=np.int32),
+        'conj_start': np.frombuffer(conj_start, dtype=np.int32),
+        'constraint_x': np.frombuffer(cx, dtype=np.int32),
+        'constraint_y': np.frombuffer(cy, dtype=np.int32),
+        'constraint_c': np.frombuffer(cc, dtype=np.int64),
+        'constraint_strict': np.frombuffer(cs, dtype=np.uint8),
+        'row_hashes': np.frombuffer(row_hashes, dtype=np.uint64),
+        'row_slots': np.frombuffer(row_slots, dtype=np.int32),
+        'row_keys': np.frombuffer(row_key_ids, dtype=np.int32),
+        'rows': np.frombuffer(row_ids, dtype=np.int32),
+    }
+    header = {'name': index.name, 'clocks': list(clocks.keys()), 'statevars': sorted(index.statevars)}
+    if index.forest is not None:
+        f = index.forest
+        header.update({'actions': f.actions, 'pointvars': f.pointvars, 'depth': f.depth,
+                       'roots_shape': list(f.roots.shape)})
+        sections.update({'roots': f.roots.astype(np.int32), 'minimize': f.minimize.astype(np.uint8),
+                         'feature': f.feature.astype(np.int32), 'bound': f.bound.astype(np.float64),
+                         'children': f.children.astype(np.int32), 'value': f.value.astype(np.float64)})
+
+    # section offsets are relative to the end of the header
+    header['sections'] = dict()
+    offset = 0
+    for name, a in sections.items():
+        header['sections'][name] = [offset, a.dtype.char, a.size]
+        offset += -(-a.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (-(PREAMBLE.size + len(header_bytes)) % ALIGNMENT)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for a in sections.values():
+            f.write(np.ascontiguousarray(a).tobytes())
+            f.write(b'\0' * (-a.nbytes % ALIGNMENT))
+    os.replace(tmp_path, path)
+    LOGGER.info('Compiled {} states, {} guards and {} regressors into {} ({} bytes).'.format(
+        len(index.states), len(guards), len(index.rows), path, os.path.getsize(path)))
+
+
+class MappedStrategy(StrategyQueries):
+    # compiled strategy queried in place: the file is mapped read-only and its sections are viewed, not copied,
+    # hence processes serving the same file share its pages and opening it does not depend on its size
+    def __init__(self, path: str):
+        if os.path.getsize(path) < PREAMBLE.size:
+            LOGGER.error('{} is not a compiled strategy.'.format(path))
+            raise RuntimeError
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self.mm)
+        if magic != MAGIC:
+            LOGGER.error('{} is not a compiled strategy.'.format(path))
+            raise RuntimeError
+        if version != FORMAT_VERSION:
+            LOGGER.error('{} has format version {}, {} expected: compile it again.'.format(path, version,
+                                                                                        FORMAT_VERSION))
+            raise RuntimeError
+        header = json.loads(self.mm[PREAMBLE.size:PREAMBLE.size + header_length])
+        self.start = PREAMBLE.size + header_length
+        self.sections: Dict[str, Tuple[int, str, int]] = header['sections']
+
+        self.name = header['name']
+        self.clocks: List[str] = header['clocks']
+        self.statevars = frozenset(header['statevars'])
+        # memoryviews are faster than arrays when reading single items
+        self.view = memoryview(self.mm)
+        for name in self.sections:
+            setattr(self, name, self.section(name))
+
+        if 'roots' in self.sections:
+            self.forest = RegressorForest(header['actions'], header['pointvars'],
+                                          self.array('roots').reshape(header['roots_shape']),
+                                          self.array('minimize').view(np.bool_), self.array('feature'),
+                                          self.array('bound'), self.array('children').reshape(-1, 2),
+                                          self.array('value'), header['depth'])
+            self.columns = {a: i for i, a in enumerate(self.forest.actions)}
+
+    def section(self, name: str):
+        offset, code, size = self.sections[name]
+        start = self.start + offset
+        return self.view[start:start + size * np.dtype(code).itemsize].cast(code)
+
+    def array(self, name: str):
+        offset, code, size = self.sections[name]
+        return np.frombuffer(self.mm, dtype=code, count=size, offset=self.start + offset)
+
+    def string(self, i: int):
+        return bytes(self.strings[self.string_offsets[i]:self.string_offsets[i + 1]])
+
+    def find(self, hashes, slots, keys, key: QueryKey):
+        k = key_string(key).encode()
+        h = key_hash(k)
+        if len(hashes) == 0:
+            return None
+        mask = len(hashes) - 1
+        slot = h & mask
+        while True:
+            i = slots[slot]
+            if i < 0:
+                return None
+            if hashes[slot] == h and self.string(keys[i]) == k:
+                return i
+            slot = (slot + 1) & mask
+
+    def lookup(self, locations: Dict[str, str], variables: Dict[str, object]):
+        s = self.find(self.state_hashes, self.state_slots, self.state_keys,
+                      query_key(locations.items(), variables.items()))
+        if s is None or self.forest is None:
+            return s, None
+        i = self.find(self.row_hashes, self.row_slots, self.row_keys,
+                      query_key(locations.items(), [(var, value) for var, value in variables.items()
+                                                    if var in self.statevars]))
+        return s, (self.rows[i] if i is not None else None)
+
+    def valuation(self, variables: Dict[str, object], clocks: Dict[str, float]):
+        # values indexed as the clocks of the constraints, None if missing
+        values: Dict[str, float] = dict()
+        for var, value in variables.items():
+            try:
+                values[var] = float(value)
+            except (TypeError, ValueError):
+                pass
+        values.update(clocks)
+        return [0.0] + [values.get(x) for x in self.clocks[1:]]
+
+    def holds(self, g: int, valuation: List[float]):
+        cx, cy, cc, cs = self.constraint_x, self.constraint_y, self.constraint_c, self.constraint_strict
+        for j in range(self.guard_start[g], self.guard_start[g + 1]):
+            for k in range(self.conj_start[j], self.conj_start[j + 1]):
+                vx, vy = valuation[cx[k]], valuation[cy[k]]
+                if vx is None or vy is None:
+                    raise KeyError(self.clocks[cx[k] if vx is None else cy[k]])
+                d = vx - vy
+                if d > cc[k] or (cs[k] and d == cc[k]):
+                    break
+            else:
+                return True
+        return False
+
+    def allowed_in(self, s: int, valuation: List[float]):
+        allowed = [self.string(self.edge_transition[e]).decode()
+                   for e in range(self.edge_start[s], self.edge_start[s + 1])
+                   if self.holds(self.edge_guard[e], valuation)]
+        return allowed, self.wait_guard[s] >= 0 and self.holds(self.wait_guard[s], valuation)
+
+
+if __name__ == '__main__':
+    from src.strategyviz.viz_config.paths import get_strategy_path
+    from src.strategyviz.strategy_server.server import load_index
+    from src.strategyviz.viz_config.config import get_config
+
+    parser = argparse.ArgumentParser(prog='strategy_compiler',
+                                     description='Compiles a strategy into a file the strategy server can map '
+                                                 'in memory, without parsing it again.')
+    parser.add_argument('out', help='path of the compiled strategy ({} by convention)'.format(COMPILED_EXT))
+    parser.add_argument('tiga_strategy', help='name of (or path to) the TIGA strategy')
+    parser.add_argument('opt_strategy', nargs='?', help='name of (or path to) the optimized strategy')
+    ARGS = parser.parse_args()
+
+    TIGA_PATH = get_strategy_path(ARGS.tiga_strategy, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+    if ARGS.opt_strategy is not None:
+        STRATEGO_PATH = get_strategy_path(ARGS.opt_strategy, get_config()['STRATEGY CONFIGURATION']['STRATEGO_EXT'])
+    else:
+        STRATEGO_PATH = None
+    write_compiled(load_index(TIGA_PATH, STRATEGO_PATH), ARGS.out)
@@ -0,0 +1,210 @@
+from abc import ABC, abstractmethod
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.strategyviz.strategy2pta.guard import Guard, ZERO, bound_value, is_strict
+from src.strategyviz.strategy2pta.opt_strategy import OptimizedStrategy
+from src.strategyviz.strategy2pta.pta import NetLocation, StateVariable
+from src.strategyviz.strategy2pta.tiga_strategy import TigaStrategy
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('STRATEGY INDEX')
+
+# (automaton locations, discrete valuation) of a network state
+QueryKey = Tuple[FrozenSet[Tuple[str, str]], FrozenSet[Tuple[str, str]]]
+# x-y ~ c as (x, y, c, strict), with ZERO standing for 0
+Constraint = Tuple[str, str, int, bool]
+# disjunction of conjunctions of constraints
+CompiledGuard = Tuple[Tuple[Constraint, ...], ...]
+
+
+def query_key(locations: Iterable[Tuple[str, str]], variables: Iterable[Tuple[str, object]]) -> QueryKey:
+    return frozenset(locations), frozenset([(var, str(value).strip()) for var, value in variables])
+
+
+def key_string(key: QueryKey):
+    # canonical string of a key, stable across processes (see compiled.py)
+    return '\0'.join(sorted(['{}.{}'.format(t, l) for t, l in key[0]])) + '\1' + \
+        '\0'.join(sorted(['{}={}'.format(var, value) for var, value in key[1]]))
+
+
+def state_query_key(locs: List[NetLocation], state_vars: List[StateVariable]) -> QueryKey:
+    return query_key([(l.tplt, l.label) for l in locs], [(v.identifier, v.value) for v in state_vars])
+
+
+def compile_guard(guard: str) -> Optional[CompiledGuard]:
+    # None if some conjunct is not a difference constraint, as it could not be evaluated
+    disjuncts: List[Tuple[Constraint, ...]] = []
+    for d in guard.split('||'):
+        g = Guard.parse(d)
+        if len(g.others) > 0:
+            return None
+        disjuncts.append(tuple([(x, y, bound_value(b), is_strict(b)) for (x, y), b in g.bounds.items()]))
+    return tuple(disjuncts)
+
+
+def holds(guard: CompiledGuard, valuation: Dict[str, float]):
+    for conjunction in guard:
+        for x, y, c, strict in conjunction:
+            d = valuation[x] - valuation[y]
+            if d > c or (strict and d == c):
+                break
+        else:
+            return True
+    return False
+
+
+def disjoin(g1: Optional[CompiledGuard], g2: CompiledGuard) -> CompiledGuard:
+    # the same state may appear in more than one block: its guards are merged, without repeating conjunctions
+    if g1 is None:
+        return g2
+    return tuple(dict.fromkeys(g1 + g2))
+
+
+class StateEntry:
+    __slots__ = ('wait', 'edges')
+
+    def __init__(self):
+        # guard under which the strategy waits, None if it never does
+        self.wait: Optional[CompiledGuard] = None
+        # transition->guard under which the strategy takes it
+        self.edges: Dict[str, CompiledGuard] = dict()
+
+
+class QueryResult:
+    __slots__ = ('allowed', 'wait', 'best')
+
+    def __init__(self, allowed: List[str], wait: bool, best: List[str]):
+        self.allowed = allowed
+        self.wait = wait
+        self.best = best
+
+    def to_dict(self):
+        return {'allowed': self.allowed, 'wait': self.wait, 'best': self.best}
+
+
+class StrategyQueries(ABC):
+    # queries shared by the in-memory index and the memory-mapped one (see compiled.py),
+    # which only differ in how states are looked up and their guards evaluated
+    forest = None
+    columns: Dict[str, int] = dict()
+    statevars: FrozenSet[str] = frozenset()
+
+    @abstractmethod
+    def lookup(self, locations: Dict[str, str], variables: Dict[str, object]):
+        # (state entry or None, regressor row or None)
+        pass
+
+    @abstractmethod
+    def valuation(self, variables: Dict[str, object], clocks: Dict[str, float]):
+        pass
+
+    @abstractmethod
+    def allowed_in(self, entry, valuation) -> Tuple[List[str], bool]:
+        pass
+
+    def allowed(self, locations: Dict[str, str], variables: Dict[str, object], clocks: Dict[str, float]):
+        entry, _ = self.lookup(locations, variables)
+        if entry is None:
+            return [], False
+        return self.allowed_in(entry, self.valuation(variables, clocks))
+
+    def query(self, locations: Dict[str, str], variables: Dict[str, object], clocks: Dict[str, float]):
+        return self.query_batch([(locations, variables, clocks)])[0]
+
+    def query_batch(self, queries: List[Tuple[Dict[str, str], Dict[str, object], Dict[str, float]]]):
+        # transitions allowed by the TIGA strategy and, among those, the best ones by the optimized strategy
+        # (all the allowed ones if there is none); the regression trees of the whole batch are evaluated at once
+        results: List[QueryResult] = []
+        rows: List[int] = []
+        points: List[List[float]] = []
+        evaluated: List[int] = []
+        for i, (locations, variables, clocks) in enumerate(queries):
+            entry, row = self.lookup(locations, variables)
+            if entry is None:
+                results.append(QueryResult([], False, []))
+                continue
+            allowed, wait = self.allowed_in(entry, self.valuation(variables, clocks))
+            results.append(QueryResult(allowed, wait, allowed))
+            if row is not None and len(allowed) > 1:
+                # point variables missing from the query (e.g., #t(0)) are taken as 0
+                rows.append(row)
+                points.append([clocks.get(v, 0.0) for v in self.forest.pointvars])
+                evaluated.append(i)
+
+        if len(evaluated) > 0:
+            values = self.forest.evaluate(np.array(rows, dtype=np.int32),
+                                          np.array(points, dtype=np.float64).reshape(len(rows), -1))
+            for i, row, row_values in zip(evaluated, rows, values):
+                r = results[i]
+                scored = [(row_values[self.columns[t]], t) for t in r.allowed if t in self.columns
+                          and not np.isnan(row_values[self.columns[t]])]
+                if len(scored) == 0:
+                    continue
+                best = min(v for v, _ in scored) if self.forest.minimize[row] else max(v for v, _ in scored)
+                r.best = [t for v, t in scored if v == best]
+        return results
+
+
+class StrategyIndex(StrategyQueries):
+    # strategy states hashed by their (locations, discrete valuation), with guards compiled once:
+    # a query is a dictionary lookup plus the evaluation of the guards of a single state
+    def __init__(self, tiga_strategy: TigaStrategy, optimized_strategy: OptimizedStrategy = None):
+        self.name = tiga_strategy.name
+        self.states: Dict[QueryKey, StateEntry] = dict()
+
+        skipped = 0
+        for block in tiga_strategy.blocks:
+            entry = self.states.setdefault(state_query_key(block.state.state.locs, block.state.state.vars),
+                                           StateEntry())
+            for e in block.edges:
+                guard = compile_guard(e.guard)
+                if guard is None:
+                    skipped += 1
+                    continue
+                entry.edges[e.transition] = disjoin(entry.edges.get(e.transition), guard)
+            if block.wait is not None:
+                guard = compile_guard(block.wait.guard)
+                if guard is None:
+                    skipped += 1
+                    continue
+                entry.wait = disjoin(entry.wait, guard)
+        if skipped > 0:
+            LOGGER.warn('{} guards cannot be evaluated, they are never satisfied.'.format(skipped))
+
+        # regressor of each state, the discrete valuation of a query is projected on the state variables of regressors
+        self.rows: Dict[QueryKey, int] = dict()
+        if optimized_strategy is not None and len(optimized_strategy.regressors) > 0:
+            self.forest = optimized_strategy.forest()
+            self.statevars = frozenset(optimized_strategy.statevars)
+            self.columns = {a: i for i, a in enumerate(self.forest.actions)}
+            for i, r in enumerate(optimized_strategy.regressors):
+                self.rows[state_query_key(r.state.state.locs, r.state.state.vars)] = i
+
+        LOGGER.info('Indexed {} states ({} with regressors).'.format(len(self.states), len(self.rows)))
+
+    def lookup(self, locations: Dict[str, str], variables: Dict[str, object]):
+        entry = self.states.get(query_key(locations.items(), variables.items()))
+        if entry is None:
+            return None, None
+        if self.forest is None:
+            return entry, None
+        row = self.rows.get(query_key(locations.items(), [(var, value) for var, value in variables.items()
+                                                         if var in self.statevars]))
+        return entry, row
+
+    def valuation(self, variables: Dict[str, object], clocks: Dict[str, float]):
+        # guards may also constrain discrete variables
+        valuation: Dict[str, float] = {ZERO: 0.0}
+        for var, value in variables.items():
+            try:
+                valuation[var] = float(value)
+            except (TypeError, ValueError):
+                pass
+        valuation.update(clocks)
+        return valuation
+
+    def allowed_in(self, entry: StateEntry, valuation: Dict[str, float]):
+        allowed = [t for t, guard in entry.edges.items() if holds(guard, valuation)]
+        return allowed, entry.wait is not None and holds(entry.wait, valuation)
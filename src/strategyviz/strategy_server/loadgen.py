@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+import socket
+import time
+from typing import Dict, List
+
+from src.strategyviz.strategy_server.compiled import MappedStrategy
+from src.strategyviz.strategy_server.index import StrategyIndex, StrategyQueries
+from src.strategyviz.strategy_server.server import load_index
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_config.paths import get_strategy_path
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('STRATEGY LOADGEN')
+
+
+def sample_queries(index: StrategyIndex, n: int, max_clock: float, seed: int = 0):
+    # random clock valuations in random strategy states
+    rnd = random.Random(seed)
+    keys = list(index.states.keys())
+    clocks = sorted(set([x for entry in index.states.values()
+                         for guard in list(entry.edges.values()) + [entry.wait or ()]
+                         for conjunction in guard for c in conjunction for x in c[:2] if x != '']))
+    queries: List[Dict] = []
+    for _ in range(n):
+        locations, variables = rnd.choice(keys)
+        queries.append({'locations': dict(locations), 'variables': dict(variables),
+                        'clocks': {x: round(rnd.uniform(0, max_clock), 2) for x in clocks}})
+    return queries
+
+
+def percentiles(latencies: List[float]):
+    latencies = sorted(latencies)
+    return {p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e6 for p in [50, 99, 99.9]}
+
+
+def report(what: str, latencies: List[float], n_queries: int, elapsed: float):
+    p = percentiles(latencies)
+    LOGGER.msg('{}: p50 {:.0f}us, p99 {:.0f}us, p99.9 {:.0f}us, max {:.0f}us, {:.0f} queries/s.'.format(
+        what, p[50], p[99], p[99.9], max(latencies) * 1e6, n_queries / elapsed))
+
+
+def run_in_process(what: str, index: StrategyQueries, queries: List[Dict], batch: int):
+    requests = [queries[i:i + batch] for i in range(0, len(queries), batch)]
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for r in requests:
+        t = time.perf_counter()
+        if batch == 1:
+            index.query(r[0]['locations'], r[0]['variables'], r[0]['clocks'])
+        else:
+            index.query_batch([(q['locations'], q['variables'], q['clocks']) for q in r])
+        latencies.append(time.perf_counter() - t)
+    report('{}, batch {}'.format(what, batch), latencies, len(queries), time.perf_counter() - start)
+
+
+def run_on_socket(socket_path: str, queries: List[Dict], batch: int):
+    # requests are sent one at a time: latencies include the round trip and (de)serialization
+    requests = [queries[i:i + batch] for i in range(0, len(queries), batch)]
+    requests = [json.dumps(r[0] if batch == 1 else {'queries': r}).encode() + b'\n' for r in requests]
+    latencies: List[float] = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        responses = s.makefile('rb')
+        start = time.perf_counter()
+        for r in requests:
+            t = time.perf_counter()
+            s.sendall(r)
+            response = json.loads(responses.readline())
+            latencies.append(time.perf_counter() - t)
+            if 'error' in response:
+                LOGGER.error(response['error'])
+                raise RuntimeError
+    report('socket, batch {}'.format(batch), latencies, len(queries), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='strategy_loadgen',
+                                     description='Measures the latency of strategy queries, in process and, '
+                                                 'if a socket is given, against a running strategy server.')
+    parser.add_argument('tiga_strategy', help='name of (or path to) the TIGA strategy')
+    parser.add_argument('opt_strategy', nargs='?', help='name of (or path to) the optimized strategy')
+    parser.add_argument('--socket', help='path of the Unix socket of the strategy server')
+    parser.add_argument('--compiled', help='path of the same strategy compiled, to be also queried in process')
+    parser.add_argument('--queries', type=int, default=20000, help='number of queries')
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 64], help='queries per request')
+    parser.add_argument('--max-clock', type=float, default=60.0, help='upper bound of the sampled clock values')
+    ARGS = parser.parse_args()
+
+    TIGA_PATH = get_strategy_path(ARGS.tiga_strategy, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+    if ARGS.opt_strategy is not None:
+        STRATEGO_PATH = get_strategy_path(ARGS.opt_strategy, get_config()['STRATEGY CONFIGURATION']['STRATEGO_EXT'])
+    else:
+        STRATEGO_PATH = None
+
+    INDEX = load_index(TIGA_PATH, STRATEGO_PATH)
+    QUERIES = sample_queries(INDEX, ARGS.queries, ARGS.max_clock)
+    MAPPED = MappedStrategy(ARGS.compiled) if ARGS.compiled is not None else None
+    for BATCH in ARGS.batch:
+        run_in_process('in-process', INDEX, QUERIES, BATCH)
+        if MAPPED is not None:
+            run_in_process('compiled', MAPPED, QUERIES, BATCH)
+        if ARGS.socket is not None:
+            run_on_socket(ARGS.socket, QUERIES, BATCH)
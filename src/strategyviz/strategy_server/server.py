@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import socketserver
+from typing import Dict
+
+from src.strategyviz.parse_cache.cache import cached
+from src.strategyviz.strategy2pta.converter import load_tiga_strategy, load_optimized_strategy
+from src.strategyviz.strategy_server.compiled import COMPILED_EXT, MappedStrategy
+from src.strategyviz.strategy_server.index import StrategyIndex, StrategyQueries
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_config.paths import get_strategy_path, get_strategy_name
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('STRATEGY SERVER')
+
+
+def load_index(tiga_path: str, stratego_path: str = None) -> StrategyQueries:
+    # compiled strategies are mapped in memory, the others are parsed (or loaded from the parse cache) once
+    if tiga_path.endswith(COMPILED_EXT):
+        return MappedStrategy(tiga_path)
+    tiga_name = get_strategy_name(tiga_path)
+    with open(tiga_path) as tiga_strategy_file:
+        tiga_strategy = cached('tiga', tiga_name, tiga_path, lambda: load_tiga_strategy(tiga_name, tiga_strategy_file))
+    optimized_strategy = None
+    if stratego_path is not None:
+        stratego_name = get_strategy_name(stratego_path)
+        optimized_strategy = cached('stratego', stratego_name, stratego_path,
+                                    lambda: load_optimized_strategy(stratego_name, stratego_path))
+    return StrategyIndex(tiga_strategy, optimized_strategy)
+
+
+def parse_query(q: Dict):
+    # e.g., {"locations": {"Kim": "Wait"}, "variables": {"retry": 1}, "clocks": {"time": 7.5, "T": 1}}
+    return q.get('locations', dict()), q.get('variables', dict()), q.get('clocks', dict())
+
+
+def answer(index: StrategyQueries, request: Dict):
+    # a request is either a single query or a batch of them: {"queries": [...]}
+    if 'queries' in request:
+        results = index.query_batch([parse_query(q) for q in request['queries']])
+        return {'results': [r.to_dict() for r in results]}
+    return index.query(*parse_query(request)).to_dict()
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    # one JSON request per line, answered by one JSON line, for as long as the client keeps the connection
+    def handle(self):
+        index: StrategyQueries = self.server.index
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                response = answer(index, json.loads(line))
+            except KeyError as e:
+                response = {'error': 'Missing valuation of {}.'.format(e)}
+            except (ValueError, TypeError, AttributeError) as e:
+                response = {'error': 'Invalid request: {}'.format(e)}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class StrategyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, index: StrategyQueries):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, QueryHandler)
+        self.index = index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='strategy_server',
+                                     description='Answers queries on the transitions allowed (and the best ones) '
+                                                 'by a strategy, over a Unix socket.')
+    parser.add_argument('socket', help='path of the Unix socket to listen on')
+    parser.add_argument('tiga_strategy', help='name of (or path to) the TIGA strategy, or path to a compiled strategy')
+    parser.add_argument('opt_strategy', nargs='?', help='name of (or path to) the optimized strategy')
+    ARGS = parser.parse_args()
+
+    TIGA_PATH = get_strategy_path(ARGS.tiga_strategy, get_config()['STRATEGY CONFIGURATION']['TIGA_EXT'])
+    if ARGS.opt_strategy is not None:
+        STRATEGO_PATH = get_strategy_path(ARGS.opt_strategy, get_config()['STRATEGY CONFIGURATION']['STRATEGO_EXT'])
+    else:
+        STRATEGO_PATH = None
+
+    with StrategyServer(ARGS.socket, load_index(TIGA_PATH, STRATEGO_PATH)) as server:
+        LOGGER.msg('Serving {} on {}.'.format(server.index.name, ARGS.socket))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(ARGS.socket)
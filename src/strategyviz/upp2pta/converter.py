@@ -1,19 +1,14 @@
-import configparser
-import sys
+import os
 import xml.etree.ElementTree as et
-from typing import List
+from typing import Dict, List
 from xml.etree.ElementTree import Element
 
+from src.strategyviz.parse_cache.cache import cached
 from src.strategyviz.strategy2pta.pta import Location, NetLocation, PTA, Edge, BranchPoint
 from src.strategyviz.viz_logging.logger import Logger
 
 LOGGER = Logger('UPPAAL2PTA CONVERTER')
 
-config = configparser.ConfigParser()
-config.sections()
-config.read("./resources/config/config.ini")
-config.sections()
-
 
 def parse_locations(tplt: Element, pta_name: str, initial_id: str):
     locations = {}
@@ -47,15 +42,15 @@ def parse_locations(tplt: Element, pta_name: str, initial_id: str):
 
 
 def parse_branchpoints(tplt: Element):
-    bps = []
+    bps: Dict[str, BranchPoint] = dict()
 
     for bp in tplt.iter('branchpoint'):
-        bps.append(BranchPoint(bp.attrib['id']))
+        bps[bp.attrib['id']] = BranchPoint(bp.attrib['id'])
 
     return bps
 
 
-def parse_edges(tplt: Element, locations, bps):
+def parse_edges(tplt: Element, locations: Dict[str, Location], bps: Dict[str, BranchPoint]):
     edges = []
 
     for trans in tplt.iter('transition'):
@@ -71,59 +66,83 @@ def parse_edges(tplt: Element, locations, bps):
         update = ''
         weight = None
         for label in trans.iter('label'):
+            # labels left empty in the editor have no text
             if label.attrib['kind'] == 'guard':
-                guard = label.text
+                guard = label.text or ''
             elif label.attrib['kind'] == 'assignment':
-                update = label.text
+                update = label.text or ''
             elif label.attrib['kind'] == 'synchronisation':
-                sync = label.text
+                sync = label.text or ''
             elif label.attrib['kind'] == 'probability':
                 weight = label.text
 
-        try:
-            source = locations[source_id]
-        except KeyError:
-            source = list(filter(lambda b: b.id == source_id, bps))[0]
-        try:
-            target = locations[target_id]
-        except KeyError:
-            target = list(filter(lambda b: b.id == target_id, bps))[0]
+        source = locations[source_id] if source_id in locations else bps[source_id]
+        target = locations[target_id] if target_id in locations else bps[target_id]
 
         edges.append(Edge(guard, sync, update, source, target, weight, controllable))
 
     return edges
 
 
-def parse_uppaal_model(view=False):
-    if len(sys.argv) < 3:
-        LOGGER.error("Wrong input parameters.")
-        raise RuntimeError
+def parse_template(tplt: Element):
+    tplt_name = tplt.find('name').text
+    initial_id = tplt.find('init').attrib['ref']
+    try:
+        local_declaration = tplt.find('declaration').text
+    except AttributeError:
+        local_declaration = ''
+
+    locations = parse_locations(tplt, tplt_name, initial_id)
+    bps = parse_branchpoints(tplt)
+    edges = parse_edges(tplt, locations, bps)
+
+    return PTA(tplt_name, list(locations.values()), edges, list(bps.values()), local_declaration)
+
+
+def instantiate(tplt: PTA, instance: str):
+    # copy of a parsed template for one of its instances (i.e., with locations named after the instance)
+    locations: Dict[str, Location] = dict()
+    for l in tplt.locations:
+        net_locs = [NetLocation(instance, n.label) for n in l.net_locs]
+        locations[l.label] = Location(net_locs, l.initial, invariant=l.invariant, urgent=l.urgent)
+    bps: Dict[str, BranchPoint] = {bp.label: bp for bp in tplt.branchpoints}
 
-    MODEL_NAME = sys.argv[1]
-    MODEL_PATH = config['MODEL CONFIGURATION']['MODEL_PATH'] + MODEL_NAME + config['MODEL CONFIGURATION']['MODEL_EXT']
+    edges: List[Edge] = []
+    for e in tplt.edges:
+        source = locations[e.start.label] if e.start.kind == 'LOC' else bps[e.start.label]
+        target = locations[e.end.label] if e.end.kind == 'LOC' else bps[e.end.label]
+        edges.append(Edge(e.guard, e.sync, e.update, source, target, e.weight, e.controllable))
 
+    return PTA(instance, list(locations.values()), edges, list(bps.values()), tplt.declarations)
+
+
+def parse_network(model_path: str):
+    templates: List[Element] = []
+    instances: List[str] = []
+
+    # the model is streamed: templates are kept as read, since the system declaration instantiating them follows
+    for _, node in et.iterparse(model_path, events=('end',)):
+        if node.tag == 'template':
+            templates.append(node)
+        elif node.tag == 'system':
+            instances = [i.replace(' ', '') for i in node.text.split('\n') if i.__contains__('=')]
+
+    # only templates with instances are parsed, each of them once
     PTAS = []
+    for node in templates:
+        pta_names = [i.split('=')[0] for i in instances if i.__contains__(node.find('name').text)]
+        if len(pta_names) > 0:
+            tplt = parse_template(node)
+            PTAS.extend([instantiate(tplt, instance) for instance in pta_names])
+        node.clear()
+
+    return PTAS
+
+
+def parse_uppaal_model(model_path: str, view=False):
+    MODEL_NAME = os.path.splitext(os.path.basename(model_path))[0]
 
-    tree = et.parse(MODEL_PATH)
-    root = tree.getroot()
-    instances = [i.text for i in root.iter('system')][0].split('\n')
-    instances = [i.replace(' ', '') for i in instances if i.__contains__('=')]
-    for tplt in root.iter('template'):
-        tplt_name = tplt.find('name').text
-        pta_names = [i.split('=')[0] for i in instances if i.__contains__(tplt_name)]
-        initial_id = tplt.find('init').attrib['ref']
-
-        for instance in pta_names:
-            try:
-                local_declaration = tplt.find('declaration').text
-            except AttributeError:
-                local_declaration = ''
-
-            locations = parse_locations(tplt, instance, initial_id)
-            bps = parse_branchpoints(tplt)
-            edges = parse_edges(tplt, locations, bps)
-
-            PTAS.append(PTA(instance, list(locations.values()), edges, bps, local_declaration))
+    PTAS = cached('network', MODEL_NAME, model_path, lambda: parse_network(model_path))
 
     if view:
         [pta.plot() for pta in PTAS]
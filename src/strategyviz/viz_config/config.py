@@ -0,0 +1,14 @@
+import configparser
+
+CONFIG_PATH = "./resources/config/config.ini"
+
+_config = None
+
+
+def get_config():
+    # the configuration file is read once, the first time a setting is needed
+    global _config
+    if _config is None:
+        _config = configparser.ConfigParser()
+        _config.read(CONFIG_PATH)
+    return _config
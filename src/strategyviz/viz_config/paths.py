@@ -0,0 +1,28 @@
+import os
+
+from src.strategyviz.viz_config.config import get_config
+
+
+# input and output paths, kept apart from the conversion pipeline so that they can be resolved without importing it
+
+
+def get_model_path(model: str):
+    # model is either the path to an .xml file or a model name in MODEL_PATH
+    if os.path.isfile(model):
+        return model
+    return get_config()['MODEL CONFIGURATION']['MODEL_PATH'] + model + get_config()['MODEL CONFIGURATION']['MODEL_EXT']
+
+
+def get_strategy_path(strategy: str, ext: str):
+    # strategy is either the path to a strategy file or a strategy name in STRATEGY_PATH
+    if os.path.isfile(strategy):
+        return strategy
+    return get_config()['STRATEGY CONFIGURATION']['STRATEGY_PATH'] + strategy + ext
+
+
+def get_strategy_name(path: str):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def get_out_path(name: str):
+    return get_config()['MODEL CONFIGURATION']['MODEL_OUT_PATH'] + name + '_optimized.xml'
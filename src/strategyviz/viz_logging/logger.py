@@ -1,11 +1,7 @@
-import configparser
 from datetime import datetime
 from enum import Enum
 
-config = configparser.ConfigParser()
-config.sections()
-config.read("./resources/config/config.ini")
-config.sections()
+from src.strategyviz.viz_config.config import get_config
 
 
 class LogLevel(Enum):
@@ -45,11 +41,18 @@ class LogLevel(Enum):
             return None
 
 
-# INIT LOGGING LEVEL BASED ON CONFIG FILE
-if 'LoggingLevel' in config['DEFAULT']:
-    MIN_LOG_LEVEL = LogLevel.parse_str(config['DEFAULT']['LoggingLevel']).value
-else:
-    MIN_LOG_LEVEL = LogLevel.WARNING.value
+# INIT LOGGING LEVEL BASED ON CONFIG FILE (on first use)
+_min_log_level = None
+
+
+def min_log_level():
+    global _min_log_level
+    if _min_log_level is None:
+        if 'LoggingLevel' in get_config()['DEFAULT']:
+            _min_log_level = LogLevel.parse_str(get_config()['DEFAULT']['LoggingLevel']).value
+        else:
+            _min_log_level = LogLevel.WARNING.value
+    return _min_log_level
 
 
 #
@@ -74,22 +77,22 @@ class Logger:
         pass
 
     def info(self, msg):
-        if MIN_LOG_LEVEL <= LogLevel.INFO.value:
+        if min_log_level() <= LogLevel.INFO.value:
             print(bcolors.OKCYAN + self.format.format(self.speaker, datetime.now(), str(LogLevel.INFO), msg), end='')
 
     def debug(self, msg):
-        if MIN_LOG_LEVEL <= LogLevel.DEBUG.value:
+        if min_log_level() <= LogLevel.DEBUG.value:
             print(bcolors.OKBLUE + self.format.format(self.speaker, datetime.now(), str(LogLevel.DEBUG), msg), end='')
 
     def warn(self, msg):
-        if MIN_LOG_LEVEL <= LogLevel.WARNING.value:
+        if min_log_level() <= LogLevel.WARNING.value:
             print(bcolors.WARNING + self.format.format(self.speaker, datetime.now(), str(LogLevel.WARNING), msg),
                   end='')
 
     def error(self, msg):
-        if MIN_LOG_LEVEL <= LogLevel.ERROR.value:
+        if min_log_level() <= LogLevel.ERROR.value:
             print(bcolors.FAIL + self.format.format(self.speaker, datetime.now(), str(LogLevel.ERROR), msg), end='')
 
     def msg(self, msg):
-        if MIN_LOG_LEVEL <= LogLevel.MSG.value:
+        if min_log_level() <= LogLevel.MSG.value:
             print(bcolors.OKGREEN + self.format.format(self.speaker, datetime.now(), str(LogLevel.MSG), msg), end='')
@@ -0,0 +1,88 @@
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List
+
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('METRICS')
+
+
+def metrics_path():
+    # runs are not recorded if no path is configured
+    return get_config().get('METRICS CONFIGURATION', 'METRICS_PATH', fallback='')
+
+
+def peak_rss_mb():
+    # peak resident set size of the process so far (ru_maxrss is in bytes on macOS, in KB elsewhere)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+def cpu_time():
+    # of the process and of its terminated children (e.g., worker pools and dot)
+    t = os.times()
+    return time.process_time() + t.children_user + t.children_system
+
+
+def file_size(path: str):
+    return os.path.getsize(path) if path is not None and os.path.isfile(path) else None
+
+
+class RunMetrics:
+    # wall time, CPU time and memory of each stage of a run, plus the sizes and counters stages record;
+    # RSS is only known as the peak of the whole process: each stage records that peak once it is over
+    # (process_peak_rss_mb) and how much the stage raised it (peak_rss_growth_mb, 0 if it stayed below it)
+    def __init__(self, run: str, **attrs):
+        self.run = run
+        self.attrs: Dict[str, Any] = attrs
+        self.stages: List[Dict[str, Any]] = []
+        self.started = datetime.now().isoformat()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = cpu_time()
+        self.start_peak_rss = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name: str, **attrs):
+        # the record is yielded, so that the stage can add its own counters
+        record: Dict[str, Any] = {'stage': name}
+        record.update(attrs)
+        start_wall, start_cpu, start_peak_rss = time.perf_counter(), cpu_time(), peak_rss_mb()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - start_wall, 6)
+            record['cpu_s'] = round(cpu_time() - start_cpu, 6)
+            record['process_peak_rss_mb'] = round(peak_rss_mb(), 1)
+            record['peak_rss_growth_mb'] = round(peak_rss_mb() - start_peak_rss, 1)
+            self.stages.append(record)
+            LOGGER.debug(json.dumps(record))
+
+    def wall_time(self, *names: str):
+        return sum([s['wall_s'] for s in self.stages if s['stage'] in names])
+
+    def to_dict(self):
+        res: Dict[str, Any] = {'run': self.run, 'started': self.started}
+        res.update(self.attrs)
+        res.update({'wall_s': round(time.perf_counter() - self.start_wall, 6),
+                    'cpu_s': round(cpu_time() - self.start_cpu, 6),
+                    'process_peak_rss_mb': round(peak_rss_mb(), 1),
+                    'peak_rss_growth_mb': round(peak_rss_mb() - self.start_peak_rss, 1), 'stages': self.stages})
+        return res
+
+    def save(self, path: str = None):
+        # one JSON line per run, appended with a single write so that concurrent runs do not interleave
+        if path is None:
+            path = metrics_path()
+        if path == '':
+            return
+        if os.path.dirname(path) != '':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.to_dict()) + '\n')
+        LOGGER.info('Run metrics saved to {}.'.format(path))
@@ -0,0 +1,401 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from src.strategyviz.strategy2pta.guard import Guard, merge_guards, union_guards, ZERO, bound, is_strict, \
+    bound_value
+from src.strategyviz.viz_config.config import get_config
+from src.strategyviz.viz_logging.logger import Logger
+
+LOGGER = Logger('GUARD SIMPLIFIER')
+
+# formulas whose disjunctive normal form is larger than this are left as they are
+MAX_DNF_SIZE = 256
+CACHE_SIZE = 4096
+
+TOKENS = re.compile(r'(\|\||&&|\(|\))')
+
+DNF = FrozenSet[Tuple[str, ...]]
+
+
+class SimplifierStats:
+    __slots__ = ('calls', 'cache_hits', 'fast_path', 'z3_calls', 'z3_simplified', 'z3_timeouts', 'z3_time',
+                 'unsimplified')
+
+    def __init__(self):
+        self.calls = 0
+        # guards whose merged disjuncts were already known
+        self.cache_hits = 0
+        self.fast_path = 0
+        self.z3_calls = 0
+        self.z3_simplified = 0
+        self.z3_timeouts = 0
+        self.z3_time = 0.0
+        self.unsimplified = 0
+
+    def __str__(self):
+        return 'Guard simplification: {} calls ({} cache hits), fast path {} ({:.1f}%), ' \
+               'z3 {} calls ({} simplified, {} timed out) in {:.2f}s, {} left unsimplified.' \
+            .format(self.calls, self.cache_hits, self.fast_path, 100 * self.fast_path / max(1, self.calls),
+                    self.z3_calls, self.z3_simplified, self.z3_timeouts, self.z3_time, self.unsimplified)
+
+
+STATS = SimplifierStats()
+
+
+_z3_available = None
+# merged disjuncts of the guards simplified last, at most CACHE_SIZE of them (least recently used first)
+_merged: 'OrderedDict[Tuple[DNF, FrozenSet[str]], Tuple[Guard, ...]]' = OrderedDict()
+# residual guards simplified by z3
+_z3_results: 'OrderedDict[Tuple[DNF, FrozenSet[str]], str]' = OrderedDict()
+
+
+def cache_get(cache: OrderedDict, key):
+    # None if the key is not cached, otherwise it becomes the most recently used
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return cache[key]
+
+
+def cache_put(cache: OrderedDict, key, value):
+    cache[key] = value
+    if len(cache) > CACHE_SIZE:
+        # the least recently used entry is evicted
+        cache.popitem(last=False)
+    return value
+
+
+def z3_enabled():
+    # z3 is an optional dependency, only looked for once
+    global _z3_available
+    if not get_config()['PTA CONFIGURATION'].getboolean('Z3_SIMPLIFY', fallback=False):
+        return False
+    if _z3_available is None:
+        try:
+            import z3
+            _z3_available = True
+        except ImportError:
+            LOGGER.warn('z3 is not installed, residual guards are not simplified.')
+            _z3_available = False
+    return _z3_available
+
+
+def to_dnf(guard: str) -> DNF:
+    # guard as a set of disjuncts, each one a tuple of (sorted) atoms;
+    # raises ValueError if the guard cannot be handled
+    tokens = [t.strip() for t in TOKENS.split(guard) if t.strip() != '']
+    pos = 0
+
+    def parse_or():
+        nonlocal pos
+        res = parse_and()
+        while pos < len(tokens) and tokens[pos] == '||':
+            pos += 1
+            res = res + parse_and()
+        return res
+
+    def parse_and():
+        nonlocal pos
+        res = parse_atom()
+        while pos < len(tokens) and tokens[pos] == '&&':
+            pos += 1
+            right = parse_atom()
+            res = [l + r for l in res for r in right]
+            if len(res) > MAX_DNF_SIZE:
+                raise ValueError
+        return res
+
+    def parse_atom():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            res = parse_or()
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise ValueError
+            pos += 1
+            return res
+        if token in ['||', '&&', ')'] or token.endswith('!') or (pos < len(tokens) and tokens[pos] == '('):
+            # negations and function calls are not supported
+            raise ValueError
+        return [(token,)]
+
+    disjuncts = parse_or()
+    if pos != len(tokens):
+        raise ValueError
+    return frozenset([tuple(sorted(set(d))) for d in disjuncts])
+
+
+def simplify_guard(guard: str, discrete: FrozenSet[str] = frozenset()):
+    return simplify_guards([guard], [discrete], workers=1)[0]
+
+
+def simplify_guards(guards: List[str], discrete: List[FrozenSet[str]], workers: int = None, timeout: float = None):
+    # equivalent guards, as simple as possible: disjuncts are merged into convex guards without any solver,
+    # z3 is only called on what cannot be merged that way, each query in a separate process
+    config = get_config()['PTA CONFIGURATION']
+    if workers is None:
+        workers = config.getint('SIMPLIFY_WORKERS', fallback=1)
+    if timeout is None:
+        timeout = config.getfloat('Z3_TIMEOUT', fallback=5.0)
+
+    res: List[str] = list(guards)
+    # guards left after the fast path, each with its merged disjuncts and the indexes of the guards it stands for
+    residuals: Dict[Tuple[DNF, FrozenSet[str]], Tuple[Tuple[Guard, ...], List[int]]] = dict()
+    for i, (guard, d) in enumerate(zip(guards, discrete)):
+        STATS.calls += 1
+        if guard.strip() == '':
+            STATS.fast_path += 1
+            continue
+        try:
+            dnf = to_dnf(guard.replace('\n', ' '))
+        except ValueError:
+            STATS.unsimplified += 1
+            continue
+
+        key = (dnf, d)
+        if cache_get(_z3_results, key) is not None:
+            res[i] = _z3_results[key]
+            continue
+        merged = merge_dnf(dnf, d)
+        if len(merged) == 1:
+            STATS.fast_path += 1
+            res[i] = str(merged[0])
+        else:
+            residuals.setdefault(key, (merged, []))[1].append(i)
+
+    if len(residuals) > 0 and z3_enabled():
+        jobs = [(merged, key[1]) for key, (merged, _) in residuals.items()]
+        for key, simplified in zip(residuals.keys(), run_z3_jobs(jobs, workers, timeout)):
+            if simplified is not None:
+                cache_put(_z3_results, key, simplified)
+    for key, (merged, indexes) in residuals.items():
+        if key in _z3_results:
+            simplified = _z3_results[key]
+        else:
+            STATS.unsimplified += len(indexes)
+            simplified = union_guards(tuple(sorted([str(g) for g in merged])), key[1])
+        for i in indexes:
+            res[i] = simplified
+
+    return res
+
+
+def merge_dnf(dnf: DNF, discrete: FrozenSet[str]) -> Tuple[Guard, ...]:
+    # disjuncts merged into as few convex guards as possible, computed once per distinct guard
+    key = (dnf, discrete)
+    merged = cache_get(_merged, key)
+    if merged is not None:
+        STATS.cache_hits += 1
+        return merged
+    return cache_put(_merged, key, tuple(merge_guards([Guard.parse(' && '.join(d), discrete) for d in sorted(dnf)])))
+
+
+def run_z3_jobs(residuals: List[Tuple[Tuple[Guard, ...], FrozenSet[str]]], workers: int, timeout: float):
+    # z3 contexts are not thread-safe, hence queries run in separate processes (or sequentially);
+    # each query is given at most timeout seconds, after which the guard is left as it is
+    jobs = [(guards, discrete, timeout) for guards, discrete in residuals]
+    STATS.z3_calls += len(jobs)
+
+    if workers <= 1 or len(jobs) == 1:
+        results = [z3_simplify_job(*job) for job in jobs]
+    else:
+        from multiprocessing import Pool, TimeoutError
+
+        # per-query timeouts are enforced by z3 itself, the deadline only guards against queries ignoring them
+        deadline = time.time() + timeout * (len(jobs) // workers + 2)
+        results = []
+        pool = Pool(processes=workers)
+        try:
+            async_results = [pool.apply_async(z3_simplify_job, job) for job in jobs]
+            for r in async_results:
+                try:
+                    results.append(r.get(timeout=max(0.0, deadline - time.time())))
+                except TimeoutError:
+                    results.append((None, timeout, True))
+        finally:
+            # workers still running past the deadline are killed, their guards are left unsimplified
+            pool.terminate()
+            pool.join()
+
+    simplified: List[Optional[str]] = []
+    timeouts = 0
+    for guard, elapsed, timed_out in results:
+        STATS.z3_time += elapsed
+        if timed_out:
+            timeouts += 1
+        elif guard is not None:
+            STATS.z3_simplified += 1
+        simplified.append(guard)
+    STATS.z3_timeouts += timeouts
+
+    if timeouts > 0:
+        LOGGER.warn('{}/{} z3 simplifications timed out after {}s, the guards were left unsimplified.'
+                    .format(timeouts, len(jobs), timeout))
+    return simplified
+
+
+def z3_simplify_job(guards: Tuple[Guard, ...], discrete: FrozenSet[str], timeout: float):
+    # returns the simplified guard (or None), the time spent and whether the query timed out
+    from z3 import Z3Exception
+
+    start_ts = time.perf_counter()
+    try:
+        guard = z3_simplify(list(guards), discrete, timeout)
+        return guard, time.perf_counter() - start_ts, False
+    except Z3Exception:
+        # z3 cancels the tactic when the timeout expires
+        return None, time.perf_counter() - start_ts, True
+
+
+def z3_simplify(guards: List[Guard], discrete: FrozenSet[str], timeout: float = None) -> Optional[str]:
+    # residual disjunctions are simplified with the tactics of the z3 experiments (see z3_test.py)
+    from z3 import And, Or, Not, Int, Real, Goal, Repeat, Then, OrElse, Tactic, TryFor, Solver, unsat
+
+    if any([len(g.others) > 0 for g in guards]):
+        return None
+
+    z3_vars = dict()
+
+    def var(v: str):
+        if v == ZERO:
+            return 0
+        if v not in z3_vars:
+            z3_vars[v] = Int(v) if v in discrete else Real(v)
+        return z3_vars[v]
+
+    def constr(key, b):
+        lhs = var(key[0]) - var(key[1])
+        return lhs < bound_value(b) if is_strict(b) else lhs <= bound_value(b)
+
+    goal = Goal()
+    goal.add(Or([And([constr(k, b) for k, b in g.bounds.items()]) for g in guards]))
+    split_solve = Repeat(Then(OrElse(Tactic('split-clause'), Tactic('skip')),
+                              Tactic('propagate-ineqs'),
+                              Tactic('ctx-solver-simplify')))
+    if timeout is not None:
+        split_solve = TryFor(split_solve, int(timeout * 1000))
+    try:
+        simplified = merge_guards([from_z3_goal(sg, discrete) for sg in split_solve(goal)])
+    except ValueError:
+        simplified = list(guards)
+    if len(simplified) == 0:
+        return None
+
+    # the tactics simplify each disjunct on its own: disjuncts implied by the others, and atoms that can be dropped
+    # given the other disjuncts (e.g., y>=1 in (x<5 && y>=1) || y<1), are then removed one at a time
+    def formula(gs: List[Guard]):
+        return Or([And([constr(k, b) for k, b in g.bounds.items()]) for g in gs])
+
+    solver = Solver()
+    if timeout is not None:
+        solver.set('timeout', int(timeout * 1000))
+
+    def implies(f1, f2):
+        # unknown (e.g., timed out) is taken as not implied
+        solver.push()
+        solver.add(And(f1, Not(f2)))
+        res = solver.check() == unsat
+        solver.pop()
+        return res
+
+    original = formula(guards)
+    i = 0
+    while i < len(simplified) and len(simplified) > 1:
+        others = simplified[:i] + simplified[i + 1:]
+        if implies(formula([simplified[i]]), formula(others)):
+            simplified = others
+        else:
+            i += 1
+    for i in range(len(simplified)):
+        for key in list(simplified[i].bounds.keys()):
+            weaker = Guard({k: b for k, b in simplified[i].bounds.items() if k != key}, discrete=discrete)
+            candidate = simplified[:i] + [weaker] + simplified[i + 1:]
+            if implies(formula(candidate), original):
+                simplified = candidate
+
+    # z3 may not reduce the disjuncts, but their atoms (e.g., (x<5 && y>=1) || y<1 into x<5 || y<1)
+    size = (sum([len(g.atoms()) for g in simplified]), len(simplified))
+    if size >= (sum([len(g.atoms()) for g in guards]), len(guards)):
+        return None
+    return union_guards(tuple(sorted([str(g) for g in simplified])), discrete)
+
+
+def from_z3_goal(goal, discrete: FrozenSet[str]):
+    from z3 import is_and, is_not, is_le, is_lt, is_ge, is_gt, is_eq
+
+    res = Guard(discrete=discrete)
+    formulas = list(goal)
+    while len(formulas) > 0:
+        f = formulas.pop()
+        if is_and(f):
+            formulas.extend(f.children())
+            continue
+        negated = is_not(f)
+        if negated:
+            f = f.children()[0]
+        if not any([is_le(f), is_lt(f), is_ge(f), is_gt(f), is_eq(f)]) or (negated and is_eq(f)):
+            raise ValueError
+
+        lhs, rhs = f.children()
+        coeffs, const = linear(lhs)
+        r_coeffs, r_const = linear(rhs)
+        for v, c in r_coeffs.items():
+            coeffs[v] = coeffs.get(v, 0) - c
+        coeffs = {v: c for v, c in coeffs.items() if c != 0}
+        c = r_const - const
+
+        # sum(coeffs) ~ c, only x ~ c, -x ~ c and x-y ~ c can be represented
+        pos = [v for v, k in coeffs.items() if k == 1]
+        neg = [v for v, k in coeffs.items() if k == -1]
+        if len(coeffs) != len(pos) + len(neg) or len(pos) > 1 or len(neg) > 1 or len(coeffs) == 0:
+            raise ValueError
+        x = pos[0] if len(pos) > 0 else ZERO
+        y = neg[0] if len(neg) > 0 else ZERO
+
+        upper = is_le(f) or is_lt(f) or is_eq(f)
+        lower = is_ge(f) or is_gt(f) or is_eq(f)
+        strict = is_lt(f) or is_gt(f)
+        if negated:
+            upper, lower, strict = lower, upper, not strict
+        bounds = []
+        if upper:
+            bounds.append(((x, y), bound(c, strict)))
+        if lower:
+            bounds.append(((y, x), bound(-c, strict)))
+        res = res.conjoin(Guard(dict(bounds), discrete=discrete))
+    return res
+
+
+def linear(term):
+    # coefficients and constant of a linear integer term
+    from z3 import is_add, is_mul, is_sub, is_const, is_int_value, is_rational_value
+
+    if is_int_value(term):
+        return dict(), term.as_long()
+    if is_rational_value(term):
+        if term.denominator_as_long() != 1:
+            raise ValueError
+        return dict(), term.numerator_as_long()
+    if is_add(term) or is_sub(term):
+        coeffs, const = dict(), 0
+        for i, child in enumerate(term.children()):
+            sign = -1 if is_sub(term) and i > 0 else 1
+            c_coeffs, c_const = linear(child)
+            for v, c in c_coeffs.items():
+                coeffs[v] = coeffs.get(v, 0) + sign * c
+            const += sign * c_const
+        return coeffs, const
+    if is_mul(term) and len(term.children()) == 2:
+        k_coeffs, k = linear(term.children()[0])
+        if len(k_coeffs) > 0:
+            raise ValueError
+        coeffs, const = linear(term.children()[1])
+        return {v: k * c for v, c in coeffs.items()}, k * const
+    if is_const(term):
+        return {str(term): 1}, 0
+    raise ValueError